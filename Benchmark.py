@@ -0,0 +1,233 @@
+# headless benchmark for PygameUI
+# builds scenes of widgets, replays synthetic input through all_objects.handleEvent and times all_objects.draw
+# on an offscreen surface.
+#
+# usage:
+#   python Benchmark.py                      run and print the results
+#   python Benchmark.py --save               also store the results as the baseline
+#   python Benchmark.py --compare            compare against the stored baseline, exits with 1 on a regression
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+import pygame
+import PygameUI
+
+SCREENSIZE = (1280, 720)
+CELLSIZE = (64, 32)
+
+# the scenes that are run, as (name, number of each widget type)
+SCENES = [
+    ("small", 10),
+    ("medium", 100),
+    ("large", 1000),
+]
+
+
+# creates count of each widget type, laid out in a grid, in a fresh all_objects group
+# count: int
+# -> PygameUI.UIObjectGroup
+def buildScene(count, fontname):
+    PygameUI.all_objects = PygameUI.UIObjectGroup()
+    columns = SCREENSIZE[0] // CELLSIZE[0]
+
+    def cell(i):
+        return (
+            (i % columns) * CELLSIZE[0] + 2,
+            (i // columns) * CELLSIZE[1] % SCREENSIZE[1] + 2,
+            CELLSIZE[0] - 4,
+            CELLSIZE[1] - 4
+        )
+
+    i = 0
+    for n in range(count):
+        PygameUI.Button(cell(i), text="OK %d" % (n % 10), fontname=fontname, onUpdate=lambda: None)
+        PygameUI.Toggle(cell(i+1), text="Tog", fontname=fontname, onUpdate=lambda x: None)
+        PygameUI.Slider(cell(i+2), 0, 10, onUpdate=lambda x: None)
+        PygameUI.Textbox(cell(i+3), text="Label %d\nline 2" % n, fontname=fontname)
+        PygameUI.Textfield(cell(i+4), defaulttext="field %d" % n, fontname=fontname, onUpdate=lambda x: None)
+        i += 5
+    return PygameUI.all_objects
+
+
+# returns a deterministic stream of mouse motion, clicks, drags and key presses
+# count: int
+# -> pygame.event.Event[]
+def makeEvents(count, seed=0):
+    rng = random.Random(seed)
+    events = []
+    pos = (0, 0)
+    while len(events) < count:
+        kind = rng.random()
+        newpos = (rng.randrange(SCREENSIZE[0]), rng.randrange(SCREENSIZE[1]))
+        if kind < 0.7:
+            events.append(pygame.event.Event(pygame.MOUSEMOTION, pos=newpos, rel=(newpos[0]-pos[0], newpos[1]-pos[1]), buttons=(0,0,0)))
+        elif kind < 0.85:
+            events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=newpos, button=1))
+            events.append(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=newpos, button=1))
+        else:
+            key = rng.choice([pygame.K_a, pygame.K_b, pygame.K_BACKSPACE, pygame.K_LEFT, pygame.K_RIGHT])
+            unicode = {pygame.K_a: "a", pygame.K_b: "b"}.get(key, "")
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=key, unicode=unicode, mod=0))
+        pos = newpos
+    return events[:count]
+
+
+# runs func and returns (seconds, traced allocation blocks, traced bytes)
+def measure(func):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "filename")
+    blocks = sum(max(s.count_diff, 0) for s in stats)
+    size = sum(max(s.size_diff, 0) for s in stats)
+    return elapsed, blocks, size
+
+
+# runs one scene and returns its results
+# -> dict
+def runScene(count, frames, eventsperframe, retained, fontname, batched=False, coalesce=False):
+    group = buildScene(count, fontname)
+    surface = pygame.Surface(SCREENSIZE)
+    surface.fill((255, 255, 255))
+    if retained:
+        group.setRetained(True, (255, 255, 255))
+    if batched:
+        group.setBatched(True)
+    events = makeEvents(frames * eventsperframe)
+
+    # warm up the caches so the first frame doesn't dominate
+    group.draw(surface)
+    cachestats = dict(PygameUI.rendercache.getStats())
+
+    eventtime = 0
+    drawtime = 0
+    coalesced = [0]
+
+    def handleAll(batch):
+        if coalesce:
+            coalesced[0] += group.handleEvents(batch)
+            return
+        for event in batch:
+            group.handleEvent(event)
+
+    def drawFrame():
+        if not retained:
+            surface.fill((255, 255, 255))
+        group.draw(surface)
+
+    for frame in range(frames):
+        batch = events[frame*eventsperframe:(frame+1)*eventsperframe]
+        start = time.perf_counter()
+        handleAll(batch)
+        eventtime += time.perf_counter() - start
+        start = time.perf_counter()
+        drawFrame()
+        drawtime += time.perf_counter() - start
+
+    # allocations are measured in a separate pass since tracing slows everything down
+    _, eventblocks, eventbytes = measure(lambda: handleAll(events[:eventsperframe]))
+    _, drawblocks, drawbytes = measure(drawFrame)
+    misses = PygameUI.rendercache.getStats()["misses"] - cachestats["misses"]
+
+    return {
+        "widgets": len(group.getObjects()),
+        "frames_per_sec": frames / drawtime if drawtime else float("inf"),
+        "events_per_sec": len(events) / eventtime if eventtime else float("inf"),
+        "event_alloc_blocks": eventblocks,
+        "event_alloc_bytes": eventbytes,
+        "draw_alloc_blocks": drawblocks,
+        "draw_alloc_bytes": drawbytes,
+        "text_renders": misses,
+        "coalesced_events": coalesced[0],
+    }
+
+
+# compares results to a baseline and returns the list of regressions
+# tolerance: float, e.g. 0.2 allows results to be 20% slower
+# -> str[]
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in ["frames_per_sec", "events_per_sec"]:
+            old = baseline[name][metric]
+            new = result[metric]
+            change = (new - old) / old
+            print("%-20s %-16s %12.1f -> %12.1f (%+.1f%%)" % (name, metric, old, new, change*100))
+            if change < -tolerance:
+                regressions.append("%s %s" % (name, metric))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless PygameUI benchmark")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--events-per-frame", type=int, default=20)
+    parser.add_argument("--scale", type=float, default=1, help="multiplies the number of widgets in every scene")
+    parser.add_argument("--font", default=PygameUI.defaultfont)
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="compare the results with the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--batched", action="store_true", help="draw the scenes with batched atlas rendering")
+    parser.add_argument("--coalesce", action="store_true", help="send each frame's events with handleEvents, merging mouse motion")
+    args = parser.parse_args()
+
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+
+    # most headless machines won't have the default font installed, use the one bundled with pygame instead
+    if args.font not in pygame.font.get_fonts():
+        PygameUI.registerFont(args.font, None)
+
+    results = {}
+    for scenename, count in SCENES:
+        for retained in [False, True]:
+            name = scenename + ("-retained" if retained else "")
+            result = runScene(int(count * args.scale), args.frames, args.events_per_frame, retained, args.font, args.batched, args.coalesce)
+            results[name] = result
+            print("%-20s %6d widgets %10.1f frames/s %12.1f events/s  draw alloc %8d B  event alloc %8d B  coalesced %6d" % (
+                name,
+                result["widgets"],
+                result["frames_per_sec"],
+                result["events_per_sec"],
+                result["draw_alloc_bytes"],
+                result["event_alloc_bytes"],
+                result["coalesced_events"]
+            ))
+
+    status = 0
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print("no baseline at %s, run with --save first" % args.baseline)
+            status = 1
+        else:
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+            if regressions:
+                print("regressions: " + ", ".join(regressions))
+                status = 1
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print("saved baseline to %s" % args.baseline)
+
+    pygame.quit()
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,3 +1,4 @@
+import asyncio
 import pygame
 import PygameUI
 
@@ -7,8 +8,6 @@ SCREENSIZE = (480, 240)
 pygame.init()
 screen = pygame.display.set_mode(SCREENSIZE)
 
-clock = pygame.time.Clock()
-
 # ui elements
 PygameUI.UIObject((20,20,100,100))
 movingrect = PygameUI.UIObject((20,120,100,100))
@@ -28,29 +27,38 @@ PygameUI.Toggle(
 
 PygameUI.Textbox((50,120,0,0), (0,0,0), text = "Text\n... and more!", fontsize = 24)
 
-PygameUI.Slider((140,20,100,20), 0, 5, sliderdefault=4, discrete=True, onUpdate=lambda x : print("slider1: ",x))
-PygameUI.Slider((140,60,100,20), 0, 5, sliderdefault=4, discrete=False, onUpdate=lambda x : print("slider2: ",x))
+# onUpdate can be a coroutine function, the slider shows that it's busy while it runs
+async def slowUpdate(x):
+    await asyncio.sleep(0.5)
+    print("slider1: ", x)
+
+slider1 = PygameUI.Slider((140,20,100,20), 0, 5, sliderdefault=4, discrete=True, onUpdate=slowUpdate)
+# a newer value makes the old one irrelevant
+slider1.setUpdateMode("immediate", cancelsuperseded=True)
+slider2 = PygameUI.Slider((140,60,100,20), 0, 5, sliderdefault=4, discrete=False, onUpdate=lambda x : print("slider2: ",x))
+# print at most once per frame while dragging
+slider2.setUpdateMode("frame")
 
 tf = PygameUI.Textfield((260, 20, 200, 40), defaulttext = "Testing\nmultiple lines")
 PygameUI.Button((260,60,100,20), text="Print", onUpdate=(lambda:print(tf.getState())))
 PygameUI.Button((360,60,100,20), text="Reset", onUpdate=tf.reset)
 
-flag = True
-while flag:
-    clock.tick(40)
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            flag = False
-        
-        PygameUI.all_objects.handleEvent(event)
-    
-    movingrect.move((clock.get_time()/1000 * movespeed, 0))
-    if movingrect.getRect()[0] > SCREENSIZE[0]:
-        rwidth = movingrect.getRect()[2]
-        movingrect.setRect([-rwidth, None, None, None])
-
-    screen.fill((255, 255, 255))
-    PygameUI.all_objects.draw(screen)
-    pygame.display.flip()
+# only redraw what changed each frame
+PygameUI.all_objects.setRetained(True, (255, 255, 255))
+
+# the moving rect slides across the screen and starts again from the left
+tweener = PygameUI.Tweener()
+
+def moveRect():
+    x, y = movingrect.getRect().topleft
+    tweener.moveTo(movingrect, (SCREENSIZE[0], y), (SCREENSIZE[0] - x) / movespeed, onDone=restartRect)
+
+def restartRect():
+    movingrect.setRect([-movingrect.getRect()[2], None, None, None])
+    moveRect()
+
+moveRect()
+
+asyncio.run(PygameUI.AsyncRunner(fps=40, onFrame=lambda seconds: tweener.update()).run())
 
 pygame.quit()
\ No newline at end of file
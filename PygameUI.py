@@ -1,37 +1,507 @@
-from unittest import TextTestRunner
 import pygame
-import copy
 import math
+import os
+import json
+import marshal
+import hashlib
+import zlib
+import re
+import collections
+import itertools
+import bisect
+import time
+import asyncio
+import threading
+import concurrent.futures
+
+# GPU rendering needs SDL2's render API, which older pygame builds don't expose
+try:
+    from pygame._sdl2 import video
+except ImportError:
+    video = None
+
+# tweens are advanced with NumPy when it's installed, and in plain Python otherwise
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# TOML scenes need Python 3.11's tomllib, JSON scenes work everywhere
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
 
 #########################
 ## Font Initialization ##
 #########################
 
 defaultfont = "sfns"
-fontpathdict = {}
+fontpathdict = {}   # font name -> path, None for pygame's default font
 fontdict = {}
+fontsources = {}    # font -> (path, size), so other threads can open their own copy
+fontlock = threading.RLock()
+
+# finding system fonts is slow, so the name -> path table is saved here and reused as long as the modification
+# times of the directories the fonts are in haven't changed. None turns the saved index off.
+fontindexpath = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "PygameUI",
+    "fontindex.json"
+)
+fontindex = None    # font name -> path, loaded on first use
+fontindexscanned = False
+
+# returns the saved font index if it is still valid, otherwise None
+# -> dict or None
+def loadFontIndex():
+    if fontindexpath is None:
+        return None
+    try:
+        with open(fontindexpath) as f:
+            saved = json.load(f)
+        for directory, mtime in saved["dirs"].items():
+            if os.stat(directory).st_mtime != mtime:
+                return None
+        return saved["fonts"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
 
-# I might add support for bold and italics here
-def getFont(fontname, fontsize):
-    if fontname not in fontpathdict:
-        if fontname in pygame.font.get_fonts():
-            fontpathdict[fontname] = pygame.font.match_font(fontname)
-        else:
+# asks pygame for every system font and saves the result
+# -> dict
+def scanFonts():
+    global fontindexscanned
+    fonts = {name: pygame.font.match_font(name) for name in pygame.font.get_fonts()}
+    fontindexscanned = True
+
+    if fontindexpath is not None:
+        dirs = {}
+        for path in fonts.values():
+            if path is not None:
+                directory = os.path.dirname(path)
+                dirs[directory] = os.stat(directory).st_mtime
+        try:
+            os.makedirs(os.path.dirname(fontindexpath), exist_ok=True)
+            with open(fontindexpath, "w") as f:
+                json.dump({"dirs": dirs, "fonts": fonts}, f)
+        except OSError:
+            # the index is only a speedup
+            pass
+    return fonts
+
+# returns the path of a font, from fontpathdict, the saved index, or a scan of the system fonts
+# fontname: str
+# -> str or None
+def findFont(fontname):
+    global fontindex
+    with fontlock:
+        if fontname in fontpathdict:
+            return fontpathdict[fontname]
+        if fontindex is None:
+            fontindex = loadFontIndex()
+        if fontindex is None or (fontname not in fontindex and not fontindexscanned):
+            # fonts may have been installed in a new directory
+            fontindex = scanFonts()
+        if fontname not in fontindex:
             message = """You do not have the font %s installed. A list of avalible fonts may be found with pygame.font.get_fonts().""" % fontname
             raise pygame.error(message)
+        fontpathdict[fontname] = fontindex[fontname]
+        return fontindex[fontname]
+
+# makes a font file available by name, e.g. one that ships with the application
+# fontname: str
+# path: str
+def registerFont(fontname, path):
+    with fontlock:
+        fontpathdict[fontname] = path
+
+# stands in for a pygame.font.Font, which is only found and opened the first time it is used.
+# Attributes are read from and set on the font, e.g. getFont("sfns", 12).bold = True, but it isn't a pygame.font.Font
+# itself, so use resolve() where a real one is needed.
+class LazyFont:
+    ownattributes = ("fontname", "fontsize", "font")
+
+    def __init__(self, fontname, fontsize):
+        self.fontname = fontname
+        self.fontsize = fontsize
+        self.font = None
+
+    # -> pygame.font.Font
+    def resolve(self):
+        # read from __dict__ so that a half made copy can't end up back in __getattr__
+        font = self.__dict__.get("font")
+        if font is None:
+            with fontlock:
+                font = self.__dict__.get("font")
+                if font is None:
+                    path = findFont(self.fontname)
+                    fontsources[self] = (path, self.fontsize)
+                    font = pygame.font.Font(path, self.fontsize)
+                    self.font = font
+        return font
+
+    def __getattr__(self, name):
+        if name.startswith("__") and name.endswith("__"):
+            # protocols like copy and pickle look these up, they aren't the font's
+            raise AttributeError(name)
+        value = getattr(self.resolve(), name)
+        if callable(value):
+            # so that later calls don't come through here
+            self.__dict__[name] = value
+        return value
+
+    def __setattr__(self, name, value):
+        if name in LazyFont.ownattributes:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.resolve(), name, value)
 
+# I might add support for bold and italics here
+# -> LazyFont
+def getFont(fontname, fontsize):
     if (fontname, fontsize) not in fontdict:
-        fontdict[(fontname, fontsize)] = pygame.font.Font(fontpathdict[fontname], fontsize)
-
+        fontdict[(fontname, fontsize)] = LazyFont(fontname, fontsize)
     return fontdict[(fontname, fontsize)]
 
+# finds and opens fonts on a background thread so they are ready before they're drawn
+# fonts: (str, int)[], (name, size) pairs to open. The font index is loaded either way
+# -> threading.Thread
+def prewarmFonts(fonts = ()):
+    def prewarm():
+        global fontindex
+        with fontlock:
+            if fontindex is None:
+                fontindex = loadFontIndex() or scanFonts()
+        for fontname, fontsize in fonts:
+            try:
+                getFont(fontname, fontsize).resolve()
+            except pygame.error:
+                # reported when the font is used
+                pass
+    thread = threading.Thread(target=prewarm, name="PygameUI-fonts", daemon=True)
+    thread.start()
+    return thread
+
+# measures text with a font without asking SDL_ttf every time. The advance of each character is looked up once
+# with font.metrics, and lines are turned into tables of prefix widths, so the width of any part of a line and
+# the character at an x position can be found without measuring again.
+# Advances don't include kerning or the overhang of the last glyph, so widths can be a pixel or two off font.size,
+# but they are where the next character starts, which is what a cursor needs.
+class FontMetrics:
+    # font: pygame.font.Font
+    # linebudget: int, the number of lines whose prefix widths are kept
+    def __init__(self, font, linebudget = 256):
+        self.font = font
+        self.advances = {}
+        self.prefixes = collections.OrderedDict()
+        self.linebudget = linebudget
+
+    # returns the x position of the start of every character in a line, plus its end
+    # line: str
+    # -> int[], len(line)+1 long
+    def getPrefixWidths(self, line):
+        prefix = self.prefixes.get(line)
+        if prefix is not None:
+            self.prefixes.move_to_end(line)
+            return prefix
+
+        advances = self.advances
+        missing = [c for c in set(line) if c not in advances]
+        if missing:
+            # one call for all the new characters
+            for c, metrics in zip(missing, self.font.metrics("".join(missing))):
+                advances[c] = 0 if metrics is None else metrics[4]
+        prefix = [0]
+        prefix.extend(itertools.accumulate(advances[c] for c in line))
+
+        self.prefixes[line] = prefix
+        if len(self.prefixes) > self.linebudget:
+            self.prefixes.popitem(last=False)
+        return prefix
+
+    # returns the width of line[start:end]
+    # -> int
+    def width(self, line, start = 0, end = None):
+        prefix = self.getPrefixWidths(line)
+        return prefix[len(line) if end is None else end] - prefix[start]
+
+    # returns the index of the character boundary in a line closest to an x position
+    # -> int
+    def indexAt(self, line, x):
+        prefix = self.getPrefixWidths(line)
+        index = bisect.bisect_left(prefix, x)
+        if index == len(prefix) or (index > 0 and x - prefix[index-1] <= prefix[index] - x):
+            index -= 1
+        return index
+
+metricsdict = {}
+
+# returns the shared FontMetrics of a font
+# font: pygame.font.Font
+# -> FontMetrics
+def getMetrics(font):
+    if font not in metricsdict:
+        metricsdict[font] = FontMetrics(font)
+    return metricsdict[font]
+
+# the ways TextWrapper can break lines
+#   "greedy": fits as many words as possible on each line
+#   "balanced": makes the lines of a paragraph about the same length, keeping the number of lines the same or close
+WRAPMODES = ("greedy", "balanced")
+
+# wraps text to a width. Widths come from FontMetrics, so no word is measured twice, and where each paragraph
+# (line of the text) breaks is cached by (paragraph, font, width, mode). Editing one paragraph, or changing the
+# width, only wraps the paragraphs that changed; the others come from the cache.
+class TextWrapper:
+    # budget: int, the number of paragraphs whose breaks are kept
+    def __init__(self, budget = 2048):
+        self.budget = budget
+        self.cache = collections.OrderedDict()
+
+    # returns where a paragraph breaks, as (start, end) indices of each line. The spaces at a break belong to
+    # no line, except at the end of the paragraph where they are kept so a cursor can be put after them.
+    # paragraph: str, without newlines
+    # font: pygame.font.Font
+    # width: int
+    # mode: str, one of WRAPMODES
+    # -> (int, int)[]
+    def getBreaks(self, paragraph, font, width, mode = "greedy"):
+        key = (paragraph, font, width, mode)
+        breaks = self.cache.get(key)
+        if breaks is not None:
+            self.cache.move_to_end(key)
+            return breaks
+
+        prefix = getMetrics(font).getPrefixWidths(paragraph)
+        words = [(m.start(), m.end()) for m in re.finditer(r"\S+", paragraph)]
+        if mode not in WRAPMODES:
+            raise ValueError("unknown wrap mode: " + str(mode))
+        breaks = None
+        if mode == "balanced" and words and all(prefix[end] - prefix[start] <= width for start, end in words):
+            breaks = self.balance(paragraph, prefix, words, width)
+            if any(font.size(paragraph[start:end])[0] > width for start, end in breaks):
+                # the estimates were off, greedy breaking checks as it goes
+                breaks = None
+        if breaks is None:
+            breaks = self.greedy(paragraph, font, prefix, words, width)
+
+        self.cache[key] = breaks
+        if len(self.cache) > self.budget:
+            self.cache.popitem(last=False)
+        return breaks
+
+    # the widths from prefix are only estimates, since SDL_ttf positions glyphs with kerning and fractions of a
+    # pixel, so every line is checked once with font.size and words are moved to the next line if it's too long
+    # -> (int, int)[]
+    def greedy(self, paragraph, font, prefix, words, width):
+        words = list(words)
+        lines = []
+        linestart = 0
+        i = 0
+        while i < len(words):
+            j = i
+            while j < len(words) and prefix[words[j][1]] - prefix[linestart] <= width:
+                j += 1
+            while j > i and font.size(paragraph[linestart:words[j-1][1]])[0] > width:
+                j -= 1
+
+            if j == i:
+                # a word that doesn't fit on a line of its own is broken between characters
+                start, end = words[i]
+                cut = max(bisect.bisect_right(prefix, prefix[linestart] + width, linestart + 1, end) - 1, linestart + 1)
+                while cut > linestart + 1 and font.size(paragraph[linestart:cut])[0] > width:
+                    cut -= 1
+                lines.append((linestart, cut))
+                linestart = cut
+                words[i] = (cut, end)
+                continue
+            if j == len(words):
+                break
+            lines.append((linestart, words[j-1][1]))
+            linestart = words[j][0]
+            i = j
+        lines.append((linestart, len(paragraph)))
+        return lines
+
+    # minimizes the sum of the squares of the space left on each line. The last line counts too, otherwise a short
+    # last line would be free and the result would look just like greedy breaking.
+    # -> (int, int)[]
+    def balance(self, paragraph, prefix, words, width):
+        count = len(words)
+        cost = [0] + [math.inf] * count
+        previous = [0] * (count + 1)
+        for j in range(1, count + 1):
+            end = prefix[words[j-1][1]]
+            for i in range(j - 1, -1, -1):
+                linewidth = end - prefix[words[i][0] if i else 0]
+                if linewidth > width and i < j - 1:
+                    break
+                slack = (width - linewidth) ** 2
+                if cost[i] + slack < cost[j]:
+                    cost[j] = cost[i] + slack
+                    previous[j] = i
+
+        lines = []
+        j = count
+        while j > 0:
+            i = previous[j]
+            lines.append((words[i][0] if i else 0, len(paragraph) if j == count else words[j-1][1]))
+            j = i
+        lines.reverse()
+        return lines
+
+    # wraps text that may have several paragraphs
+    # text: str
+    # -> str[], the lines
+    def wrap(self, text, font, width, mode = "greedy"):
+        lines = []
+        for paragraph in text.split("\n"):
+            for start, end in self.getBreaks(paragraph, font, width, mode):
+                lines.append(paragraph[start:end])
+        return lines
+
+    def clear(self):
+        self.cache.clear()
+
+textwrapper = TextWrapper()
+
 
 #############
 ## Helpers ##
 #############
 
-def inRect(pos, rect):
-    return (0 <= pos[0]-rect[0] <= rect[2]) and (0 <= pos[1]-rect[1] <= rect[3])
+# the number of surfaces the library has allocated, used by Profiler to attribute allocations to objects
+surfaceallocations = 0
+
+# counts a surface allocation in surfaceallocations
+def countSurface():
+    global surfaceallocations
+    surfaceallocations += 1
+
+# allocates a surface, counting it in surfaceallocations
+# size: int[2]
+# flags: int
+# -> pygame.Surface
+def newSurface(size, flags = 0):
+    countSurface()
+    return pygame.Surface(size, flags)
+
+# derived colors shared between all objects, keyed by (r, g, b, a, factor)
+palettecache = {}
+
+# returns color with its value (as in hsva) multiplied by factor, e.g. the hovered version of a button color.
+# the result is shared between every caller asking for the same color, so it must not be modified.
+# color: int[3] or pygame.color
+# factor: float
+# -> pygame.Color
+def paletteColor(color, factor = 1):
+    color = pygame.Color(color)
+    key = (color.r, color.g, color.b, color.a, factor)
+    shade = palettecache.get(key)
+    if shade is None:
+        if factor != 1:
+            oldhsva = color.hsva
+            color.hsva = (oldhsva[0],oldhsva[1],oldhsva[2]*factor,oldhsva[3])
+        shade = color
+        palettecache[key] = shade
+    return shade
+
+# a size limited LRU cache of rendered lines of text, shared between all UI objects.
+# the budget is in bytes and is estimated from the size of the cached surfaces.
+# surfaces returned by the cache are shared, so they should be blitted but never drawn on.
+# lookup and store can also be used directly to cache other surfaces under any hashable key.
+class RenderCache:
+    def __init__(self, budget = 8*1024*1024):
+        self.budget = budget
+        self.entries = collections.OrderedDict()
+        self.memory = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # returns font.render(text, antialiased, textcolor, bgcolor), only rendering on a cache miss
+    # font: pygame.font.Font
+    # text: str
+    # antialiased: bool
+    # textcolor: int[3] or pygame.color
+    # bgcolor: int[3] or pygame.color or None
+    # -> pygame.Surface
+    def render(self, font, text, antialiased, textcolor, bgcolor = None):
+        key = (font, text, antialiased, tuple(textcolor), None if bgcolor is None else tuple(bgcolor))
+        surface = self.lookup(key)
+        if surface is None:
+            surface = font.render(text, antialiased, textcolor, bgcolor)
+            countSurface()
+            self.store(key, surface)
+        return surface
+
+    # returns the surface cached under key, or None on a miss
+    # key: any hashable
+    # -> pygame.Surface or None
+    def lookup(self, key):
+        surface = self.entries.get(key)
+        if surface is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return surface
+
+    # caches a surface under key, evicting older surfaces if the cache goes over budget
+    # key: any hashable
+    # surface: pygame.Surface
+    def store(self, key, surface):
+        self.remove(key)
+        size = surface.get_width() * surface.get_height() * surface.get_bytesize()
+        # anything bigger than the whole budget would just evict everything else
+        if size <= self.budget:
+            self.entries[key] = surface
+            self.memory += size
+            self.shrink()
+
+    # removes the surface cached under key, if there is one
+    # key: any hashable
+    def remove(self, key):
+        surface = self.entries.pop(key, None)
+        if surface is not None:
+            self.memory -= surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    # evicts the least recently used surfaces until the cache is within its budget
+    def shrink(self):
+        while self.memory > self.budget and self.entries:
+            _, surface = self.entries.popitem(last=False)
+            self.memory -= surface.get_width() * surface.get_height() * surface.get_bytesize()
+            self.evictions += 1
+
+    # changes the memory budget, evicting surfaces if necessary
+    # budget: int
+    def setBudget(self, budget):
+        self.budget = budget
+        self.shrink()
+
+    # empties the cache. The counters are kept.
+    def clear(self):
+        self.entries.clear()
+        self.memory = 0
+
+    # returns the hit/miss/eviction counters along with the current memory use
+    # -> dict
+    def getStats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "memory": self.memory,
+            "budget": self.budget
+        }
+
+rendercache = RenderCache()
+
+# renders a single line of text through the shared render cache
+def renderLine(font, text, antialiased, textcolor, bgcolor = None):
+    return rendercache.render(font, text, antialiased, textcolor, bgcolor)
 
 # renders text to a surface (very similar to font.render) but supports newlines
 # spacing does not count the text's height, so single spaced is spacing=1
@@ -45,13 +515,13 @@ def multilineFontRender(font, text, antialiased, textcolor, bgcolor, spacing=1.1
         neededheight += rendersize[1] * spacing
         # this gets us slightly more space than we need on the last line, but that shouldn't affect anything
 
-    textsurface = pygame.surface.Surface((neededwidth, neededheight), pygame.SRCALPHA)
+    textsurface = newSurface((neededwidth, neededheight), pygame.SRCALPHA)
     textsurface.fill((0,0,0,0))
     accumheight = 0
 
     for line in splittext:
         textsurface.blit(
-            font.render(line, antialiased, textcolor, bgcolor),
+            renderLine(font, line, antialiased, textcolor, bgcolor),
             [0,accumheight,0,0]
         )
         rendersize = font.size(line)
@@ -59,6 +529,704 @@ def multilineFontRender(font, text, antialiased, textcolor, bgcolor, spacing=1.1
     
     return textsurface
 
+# lays out and renders multiline text on a pool of worker threads, so that big texts don't hold up a frame.
+# Fonts can't be shared between threads, so each worker opens its own copy of the fonts it uses. Finished jobs
+# are handed back to their owners on the main thread by collect(), which UIObjectGroup.draw calls every frame.
+class TextRasterizer:
+    def __init__(self, workers = 2):
+        self.workers = workers
+        self.executor = None
+        self.local = threading.local()
+        self.finished = collections.deque()
+        self.pending = set()    # futures that haven't finished, guarded by pendinglock
+        self.pendinglock = threading.Lock()
+
+    # returns the calling worker's copy of a font
+    # font: pygame.font.Font, from getFont
+    # -> pygame.font.Font
+    def getWorkerFont(self, font):
+        fonts = getattr(self.local, "fonts", None)
+        if fonts is None:
+            fonts = self.local.fonts = {}
+        source = fontsources[font]
+        if source not in fonts:
+            # opening fonts isn't thread safe
+            with fontlock:
+                fonts[source] = pygame.font.Font(*source)
+        return fonts[source]
+
+    # runs on a worker, returns the lines, the y position of each line, and the rendered text
+    # -> (str[], float[], pygame.Surface)
+    def render(self, font, text, textcolor, bgcolor, spacing):
+        font = self.getWorkerFont(font)
+        lines = text.split("\n")
+        lineys = []
+        rendered = []
+        neededwidth = 0
+        accumheight = 0
+        for line in lines:
+            lineys.append(accumheight)
+            if bgcolor is None:
+                linesurface = font.render(line, True, textcolor)
+            else:
+                linesurface = font.render(line, True, textcolor, bgcolor)
+            rendered.append(linesurface)
+            neededwidth = max(neededwidth, linesurface.get_width())
+            accumheight += linesurface.get_height() * spacing
+
+        # not newSurface, the allocation counter belongs to the main thread
+        textsurface = pygame.Surface((neededwidth, int(accumheight)), pygame.SRCALPHA)
+        textsurface.fill((0,0,0,0))
+        for y, linesurface in zip(lineys, rendered):
+            textsurface.blit(linesurface, (0, y))
+        return (lines, lineys, textsurface)
+
+    # starts rendering text for owner, whose textReady() is called from collect() once it's done
+    # -> concurrent.futures.Future
+    def submit(self, owner, font, text, textcolor, bgcolor, spacing = 1.15):
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="PygameUI-text")
+        font.resolve()
+        future = self.executor.submit(self.render, font, text, textcolor, bgcolor, spacing)
+        with self.pendinglock:
+            self.pending.add(future)
+        future.add_done_callback(lambda future: self.jobDone(future, owner))
+        return future
+
+    def jobDone(self, future, owner):
+        with self.pendinglock:
+            self.pending.discard(future)
+        self.finished.append(owner)
+
+    # tells the owners of finished jobs, must be called from the main thread
+    def collect(self):
+        while self.finished:
+            self.finished.popleft().textReady()
+
+    # blocks until every submitted job has finished and tells their owners, e.g. so that what a frame shows
+    # doesn't depend on how fast the workers are. Must be called from the main thread.
+    # -> int, the number of jobs that finished
+    def wait(self):
+        with self.pendinglock:
+            pending = list(self.pending)
+        concurrent.futures.wait(pending)
+        count = len(self.finished)
+        self.collect()
+        return count
+
+    # stops the workers
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+textrasterizer = TextRasterizer()
+
+# merges runs of MOUSEMOTION events into one event at the last position, with rel added up. A run ends at any
+# other event or when the held buttons (or anything else about the event, e.g. the window) change, so presses,
+# releases and drags still arrive in the same order and state.
+# events: pygame.event.Event[]
+# -> (pygame.event.Event[], int), the merged events and the number of events that were merged away
+def coalesceEvents(events):
+    merged = []
+    coalesced = 0
+    run = None  # [attributes of the run's first event, summed rel, last event]
+    for event in events:
+        if event.type == pygame.MOUSEMOTION:
+            attributes = event.dict
+            if run is not None and all(
+                attributes.get(key) == value for key, value in run[0].items() if key not in ("pos", "rel")
+            ) and len(attributes) == len(run[0]):
+                rel = attributes.get("rel", (0, 0))
+                run[1] = (run[1][0] + rel[0], run[1][1] + rel[1])
+                run[2] = event
+                coalesced += 1
+                continue
+            if run is not None:
+                merged.append(finishMotion(run))
+            run = [attributes, tuple(attributes.get("rel", (0, 0))), event]
+        else:
+            if run is not None:
+                merged.append(finishMotion(run))
+                run = None
+            merged.append(event)
+    if run is not None:
+        merged.append(finishMotion(run))
+    return merged, coalesced
+
+# returns the event that stands in for a run of motion events in coalesceEvents
+# -> pygame.event.Event
+def finishMotion(run):
+    first, rel, last = run
+    if first is last.dict:
+        return last
+    attributes = dict(last.dict)
+    attributes["rel"] = rel
+    return pygame.event.Event(pygame.MOUSEMOTION, attributes)
+
+# combines any overlapping rectangles so that no area is redrawn twice
+# rects: pygame.Rect[]
+# -> pygame.Rect[]
+def mergeRects(rects):
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        # keep absorbing overlapping rects until nothing else overlaps
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+# a uniform grid of cells used to find the objects near a point or rect without checking every object.
+# rects are treated as including their right and bottom edges, so the objects found are never fewer than
+# pygame.Rect.collidepoint would accept.
+class SpatialGrid:
+    def __init__(self, cellsize = 64):
+        self.cellsize = cellsize
+        self.cells = {}         # (column, row) -> objects in that cell, dicts are used as ordered sets
+        self.objectcells = {}   # object -> list of (column, row)
+
+    # returns the keys of all the cells a rect touches
+    # rect: int[4]
+    # -> (int, int)[]
+    def getCells(self, rect):
+        x0 = math.floor(rect[0] / self.cellsize)
+        y0 = math.floor(rect[1] / self.cellsize)
+        x1 = math.floor((rect[0] + rect[2]) / self.cellsize)
+        y1 = math.floor((rect[1] + rect[3]) / self.cellsize)
+        return [(x, y) for x in range(x0, x1+1) for y in range(y0, y1+1)]
+
+    # adds an object, or moves it if it is already in the grid
+    # object: any hashable
+    # rect: int[4]
+    def insert(self, object, rect):
+        newcells = self.getCells(rect)
+        oldcells = self.objectcells.get(object)
+        if oldcells == newcells:
+            return
+        if oldcells is not None:
+            self.remove(object)
+        for key in newcells:
+            if key not in self.cells:
+                self.cells[key] = {}
+            self.cells[key][object] = None
+        self.objectcells[object] = newcells
+
+    # removes an object from the grid, does nothing if it is not in the grid
+    # object: any hashable
+    def remove(self, object):
+        for key in self.objectcells.pop(object, ()):
+            cell = self.cells[key]
+            del cell[object]
+            if not cell:
+                del self.cells[key]
+
+    # returns the objects whose cells contain the point. These are only candidates, the caller should
+    # still check the object's actual rect.
+    # pos: int[2]
+    # -> iterable of objects
+    def queryPoint(self, pos):
+        return self.cells.get((math.floor(pos[0] / self.cellsize), math.floor(pos[1] / self.cellsize)), ())
+
+    # returns the objects whose cells overlap the rect, again only candidates
+    # rect: int[4]
+    # -> set of objects
+    def queryRect(self, rect):
+        found = set()
+        for key in self.getCells(rect):
+            if key in self.cells:
+                found.update(self.cells[key])
+        return found
+
+    def clear(self):
+        self.cells.clear()
+        self.objectcells.clear()
+
+# stores text as a list of lines, so an edit only has to rebuild the line it happens on.
+# positions are (row, column) pairs, where column len(line) is the line break at the end of the line.
+# linecache has one slot per line that the owner of the buffer can keep layout information in,
+# the slots of edited lines are reset to None. firstchanged is the first row that has been edited
+# since the owner last set it to None.
+class TextBuffer:
+    def __init__(self, text = ""):
+        self.setText(text)
+
+    # replaces all of the text
+    # text: str
+    def setText(self, text):
+        self.lines = text.split("\n")
+        self.linecache = [None] * len(self.lines)
+        self.length = len(text)
+        self.text = text
+        self.firstchanged = 0
+
+    def __len__(self):
+        return self.length
+
+    # returns the text as a single string. This is cached until the next edit.
+    # -> str
+    def getText(self):
+        if self.text is None:
+            self.text = "\n".join(self.lines)
+        return self.text
+
+    def getLineCount(self):
+        return len(self.lines)
+
+    def getLine(self, row):
+        return self.lines[row]
+
+    # returns the position at the very end of the text
+    # -> (int, int)
+    def getEnd(self):
+        return (len(self.lines)-1, len(self.lines[-1]))
+
+    # converts a (row, column) position to an index into getText()
+    # -> int
+    def toIndex(self, row, col):
+        return sum(map(len, itertools.islice(self.lines, row))) + row + col
+
+    # converts an index into getText() to a (row, column) position
+    # -> (int, int)
+    def toRowCol(self, index):
+        for row, line in enumerate(self.lines):
+            if index <= len(line):
+                return (row, index)
+            index -= len(line) + 1
+        return self.getEnd()
+
+    # returns the position one character before the given one, which should not be the start
+    # -> (int, int)
+    def stepBack(self, row, col):
+        if col > 0:
+            return (row, col-1)
+        return (row-1, len(self.lines[row-1]))
+
+    # returns the position one character after the given one, which should not be the end
+    # -> (int, int)
+    def stepForward(self, row, col):
+        if col < len(self.lines[row]):
+            return (row, col+1)
+        return (row+1, 0)
+
+    # returns the closest position before (row, col) holding one of chars, or None if there isn't one.
+    # a "\n" in chars matches line breaks
+    # -> (int, int) or None
+    def findBackward(self, row, col, chars):
+        segment = self.lines[row][:col]
+        while True:
+            found = max(segment.rfind(c) for c in chars)
+            if found != -1:
+                return (row, found)
+            if row == 0:
+                return None
+            row -= 1
+            if "\n" in chars:
+                return (row, len(self.lines[row]))
+            segment = self.lines[row]
+
+    # returns the closest position at or after (row, col) holding one of chars, or None if there isn't one.
+    # -> (int, int) or None
+    def findForward(self, row, col, chars):
+        while True:
+            line = self.lines[row]
+            found = [i for i in (line.find(c, col) for c in chars) if i != -1]
+            if found:
+                return (row, min(found))
+            if row == len(self.lines)-1:
+                return None
+            if "\n" in chars:
+                return (row, len(line))
+            row += 1
+            col = 0
+
+    # inserts text at a position and returns the position just after it
+    # -> (int, int)
+    def insert(self, row, col, text):
+        line = self.lines[row]
+        parts = text.split("\n")
+        if len(parts) == 1:
+            self.replaceLines(row, row, [line[:col] + text + line[col:]])
+            return (row, col + len(text))
+        parts[0] = line[:col] + parts[0]
+        endcol = len(parts[-1])
+        parts[-1] = parts[-1] + line[col:]
+        self.replaceLines(row, row, parts)
+        return (row + len(parts) - 1, endcol)
+
+    # deletes the text between two positions, the first of which should come first
+    def delete(self, row0, col0, row1, col1):
+        self.replaceLines(row0, row1, [self.lines[row0][:col0] + self.lines[row1][col1:]])
+
+    # replaces the lines row0 to row1 (inclusive) with newlines, keeping everything else in sync
+    def replaceLines(self, row0, row1, newlines):
+        oldlength = sum(map(len, self.lines[row0:row1+1])) + row1 - row0
+        self.length += sum(map(len, newlines)) + len(newlines) - 1 - oldlength
+        self.lines[row0:row1+1] = newlines
+        self.linecache[row0:row1+1] = [None] * len(newlines)
+        self.text = None
+        if self.firstchanged is None or row0 < self.firstchanged:
+            self.firstchanged = row0
+
+# collects timings from the UIObjectGroups it is attached to (see UIObjectGroup.setProfiler).
+# for every object and every class it records the time spent in draw, handleEvent and onUpdate, how many times
+# each was called, and how many surfaces were allocated while drawing. Event times include the time spent in
+# the onUpdate calls they trigger. It also keeps the times of the last historysize frames.
+class Profiler:
+    STATNAMES = ["draw_time", "draw_calls", "event_time", "event_calls", "update_time", "update_calls", "surfaces"]
+
+    def __init__(self, historysize = 600):
+        self.objectstats = {}
+        self.classstats = {}
+        self.frametimes = collections.deque(maxlen=historysize)
+
+    # returns the stats dict for a key, creating it if needed
+    def getStats(self, table, key):
+        stats = table.get(key)
+        if stats is None:
+            stats = dict.fromkeys(self.STATNAMES, 0)
+            table[key] = stats
+        return stats
+
+    # adds a measurement to both the object's and its class's stats
+    def record(self, object, kind, elapsed, surfaces = 0):
+        for stats in [self.getStats(self.objectstats, object), self.getStats(self.classstats, type(object).__name__)]:
+            stats[kind + "_time"] += elapsed
+            stats[kind + "_calls"] += 1
+            stats["surfaces"] += surfaces
+
+    # gets an object's blits for a batched draw, recording how long it took. The blits themselves are
+    # done together with other objects', so they only count towards the frame time
+    # -> list or None
+    def profileBlits(self, object, atlas, clip):
+        surfaces = surfaceallocations
+        start = time.perf_counter()
+        blits = object.getBlits(atlas, clip)
+        self.record(object, "draw", time.perf_counter() - start, surfaceallocations - surfaces)
+        return blits
+
+    # draws an object, recording how long it took
+    def profileDraw(self, object, surface):
+        surfaces = surfaceallocations
+        start = time.perf_counter()
+        object.draw(surface)
+        self.record(object, "draw", time.perf_counter() - start, surfaceallocations - surfaces)
+
+    # sends an event to an object, recording how long it took
+    def profileEvent(self, object, event):
+        start = time.perf_counter()
+        object.handleEvent(event)
+        self.record(object, "event", time.perf_counter() - start)
+
+    # calls an object's onUpdate, recording how long it took
+    def profileUpdate(self, object, args):
+        start = time.perf_counter()
+        result = object.onUpdate(*args)
+        self.record(object, "update", time.perf_counter() - start)
+        return result
+
+    # draws a whole group, recording the frame time
+    # -> pygame.Rect[]
+    def profileFrame(self, group, surface):
+        start = time.perf_counter()
+        rects = group.drawFrame(surface)
+        self.frametimes.append(time.perf_counter() - start)
+        return rects
+
+    # sends an event through a group. onUpdate calls made while handling it are recorded too
+    def profileEvents(self, group, event):
+        global activeprofiler
+        previous = activeprofiler
+        activeprofiler = self
+        try:
+            group.routeEvent(event)
+        finally:
+            activeprofiler = previous
+
+    # returns the stats of a single object, or None if it hasn't been recorded
+    # object: UIObject
+    # -> dict or None
+    def getObjectStats(self, object):
+        return self.objectstats.get(object)
+
+    # returns the stats of every class that has been recorded, keyed by class name
+    # -> dict
+    def getClassStats(self):
+        return self.classstats
+
+    # returns the n objects with the highest value of a stat, e.g. the slowest objects to draw
+    # stat: str, one of Profiler.STATNAMES
+    # n: int
+    # -> (UIObject, dict)[]
+    def getTopObjects(self, stat = "draw_time", n = 10):
+        return sorted(self.objectstats.items(), key=lambda item: item[1][stat], reverse=True)[:n]
+
+    # returns the number of recorded frames and their mean, max and percentile times, in seconds
+    # -> dict
+    def getFrameStats(self):
+        times = sorted(self.frametimes)
+        if not times:
+            return {"frames": 0}
+        def percentile(p):
+            return times[min(int(p * len(times)), len(times)-1)]
+        return {
+            "frames": len(times),
+            "mean": sum(times) / len(times),
+            "max": times[-1],
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+        }
+
+    # returns a histogram of the recorded frame times. Each bucket counts the frames that took at most its
+    # bound (in milliseconds) and more than the previous bound, the last bucket counts everything slower.
+    # bounds: float[]
+    # -> (float, int)[]
+    def getHistogram(self, bounds = (1, 2, 4, 8, 16, 33, 50, 100)):
+        counts = [0] * (len(bounds) + 1)
+        for frametime in self.frametimes:
+            counts[bisect.bisect_left(bounds, frametime * 1000)] += 1
+        return list(zip(list(bounds) + [math.inf], counts))
+
+    # forgets everything that has been recorded
+    def reset(self):
+        self.objectstats.clear()
+        self.classstats.clear()
+        self.frametimes.clear()
+
+# the profiler of the group currently handling an event, so that onUpdate calls can be attributed to it
+activeprofiler = None
+
+# bakes widget backgrounds (rounded rects) into shared atlas pages, so each distinct (size, color, radius) is only
+# rasterized once. Groups in batched mode (see UIObjectGroup.setBatched) blit from the pages with Surface.blits.
+# backgrounds are packed into shelves: rows of the page that hold backgrounds of about the same height.
+# Packed backgrounds can't be freed one at a time, so when the pages would go over the memory budget the page that
+# was used least recently is dropped along with everything on it. Backgrounds still in use are baked again the next
+# time they're drawn.
+class WidgetAtlas:
+    # pagesize: int
+    # budget: int, the most memory in bytes the pages can use
+    def __init__(self, pagesize = 1024, budget = 16*1024*1024):
+        self.pagesize = pagesize
+        self.budget = budget
+        self.pages = []     # each page is [surface, shelves], each shelf is [y, height, used width]
+        self.entries = collections.OrderedDict()    # (width, height, color, radius) -> (page surface, area)
+        self.memory = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # returns the page and area holding a rounded rect, baking it if it hasn't been seen before
+    # size: int[2]
+    # color: int[3] or pygame.color
+    # radius: int
+    # -> (pygame.Surface, pygame.Rect)
+    def getBackground(self, size, color, radius):
+        key = (size[0], size[1], tuple(color), radius)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        page, area = self.allocate(size)
+        page.fill((0,0,0,0), area)
+        pygame.draw.rect(page, color, area, border_radius=radius)
+        entry = (page, area)
+        self.entries[key] = entry
+        return entry
+
+    # finds space for a rect of the given size, adding a page if needed
+    # size: int[2]
+    # -> (pygame.Surface, pygame.Rect)
+    def allocate(self, size):
+        width, height = size
+        if width > self.pagesize or height > self.pagesize:
+            # too big to share a page. It gets a page of its own that is kept by its entry and never packed
+            self.makeRoom(width * height * 4)
+            page = newSurface(size, pygame.SRCALPHA)
+            self.memory += page.get_width() * page.get_height() * page.get_bytesize()
+            return page, page.get_rect()
+
+        for page, shelves in self.pages:
+            # shelves that are much taller than needed would waste space
+            for shelf in shelves:
+                if height <= shelf[1] <= height * 3 // 2 + 1 and shelf[2] + width <= page.get_width():
+                    shelf[2] += width
+                    return page, pygame.Rect(shelf[2] - width, shelf[0], width, height)
+            top = shelves[-1][0] + shelves[-1][1] if shelves else 0
+            if top + height <= page.get_height():
+                shelves.append([top, height, width])
+                return page, pygame.Rect(0, top, width, height)
+
+        self.makeRoom(self.pagesize * self.pagesize * 4)
+        page = newSurface((self.pagesize, self.pagesize), pygame.SRCALPHA)
+        page.fill((0,0,0,0))
+        self.memory += page.get_width() * page.get_height() * page.get_bytesize()
+        self.pages.append([page, [[0, height, width]]])
+        return page, pygame.Rect(0, 0, width, height)
+
+    # drops the least recently used pages until another size bytes fit in the budget. A page was last used when
+    # the most recently used background on it was. Dropped pages aren't cleared, so anything already about to be
+    # blitted from them this frame still looks right.
+    # size: int
+    def makeRoom(self, size):
+        while self.entries and self.memory + size > self.budget:
+            # entries are in order of use, so the page seen last is the one used least recently
+            lastused = {}
+            for page, area in reversed(self.entries.values()):
+                lastused[page] = None
+            victim = next(reversed(lastused))
+            for key in [key for key, entry in self.entries.items() if entry[0] is victim]:
+                del self.entries[key]
+            self.pages = [page for page in self.pages if page[0] is not victim]
+            self.memory -= victim.get_width() * victim.get_height() * victim.get_bytesize()
+            self.evictions += 1
+
+    # changes the memory budget, dropping pages if necessary
+    # budget: int
+    def setBudget(self, budget):
+        self.budget = budget
+        self.makeRoom(0)
+
+    # forgets every baked background. The counters are kept.
+    def clear(self):
+        self.pages = []
+        self.entries.clear()
+        self.memory = 0
+
+    # returns the hit/miss/eviction counters along with the current memory use
+    # -> dict
+    def getStats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "pages": len(self.pages),
+            "memory": self.memory,
+            "budget": self.budget
+        }
+
+widgetatlas = WidgetAtlas()
+
+# render backends do the drawing for UIObjectGroup.draw. A backend has
+#   render(group, target) -> pygame.Rect[]     draws the group's objects onto the target
+#   invalidateObject(object)                    called when an object's appearance changes
+#   removeObject(object)                        called when an object leaves the group
+#   present(rects)                              shows the rendered frame
+
+# draws with pygame.draw and Surface.blit, in immediate or retained mode depending on the group
+class SoftwareBackend:
+    # group: UIObjectGroup
+    # target: pygame.Surface
+    # -> pygame.Rect[]
+    def render(self, group, target):
+        return group.drawSoftware(target)
+
+    # shows what was rendered on the display
+    # rects: pygame.Rect[], the result of render
+    def present(self, rects):
+        pygame.display.update(rects)
+
+    def invalidateObject(self, object):
+        pass
+
+    def removeObject(self, object):
+        pass
+
+softwarebackend = SoftwareBackend()
+
+# composites with an SDL renderer. Each object is drawn once into its own surface, which is uploaded as a texture
+# and then only re-uploaded after the object is invalidated, so unchanged objects only cost a texture copy per frame.
+# The target passed to render is ignored, everything goes to the renderer. Call renderer.present() to show the frame.
+class TextureBackend:
+    # renderer: pygame._sdl2.video.Renderer
+    # bgcolor: int[3] or pygame.color
+    def __init__(self, renderer, bgcolor = (255,255,255)):
+        self.renderer = renderer
+        self.bgcolor = pygame.Color(bgcolor)
+        self.textures = {}  # object -> (texture, drawn rect)
+        self.stale = {}     # objects that need re-uploading, used as an ordered set
+        self.uploads = 0
+
+    def render(self, group, target):
+        renderer = self.renderer
+        renderer.draw_color = self.bgcolor
+        renderer.clear()
+        for o in group.objects:
+            entry = self.textures.get(o)
+            if entry is None or o in self.stale:
+                entry = self.upload(o, entry, group.profiler)
+            if entry[0] is not None:
+                entry[0].draw(dstrect=entry[1])
+        self.stale.clear()
+        return [renderer.get_viewport()]
+
+    def present(self, rects):
+        self.renderer.present()
+
+    # redraws an object into a surface and copies it to its texture, reusing the texture when the size is the same
+    # object: UIObject
+    # entry: (Texture, pygame.Rect) or None
+    # profiler: Profiler or None
+    # -> (Texture, pygame.Rect)
+    def upload(self, object, entry, profiler):
+        drawrect = object.getDrawRect()
+        if drawrect.width <= 0 or drawrect.height <= 0:
+            entry = (None, drawrect)
+            self.textures[object] = entry
+            return entry
+
+        surface = newSurface(drawrect.size, pygame.SRCALPHA)
+        surface.fill((0,0,0,0))
+        # objects draw at their rect, so shift them to the surface's origin while they draw
+        object.rect.move_ip(-drawrect[0], -drawrect[1])
+        try:
+            if profiler is None:
+                object.draw(surface)
+            else:
+                profiler.profileDraw(object, surface)
+            if object.updatetask is not None:
+                object.drawPending(surface)
+        finally:
+            object.rect.move_ip(drawrect[0], drawrect[1])
+
+        if entry is not None and entry[0] is not None and entry[0].get_rect().size == drawrect.size:
+            texture = entry[0]
+            texture.update(surface)
+        else:
+            texture = video.Texture.from_surface(self.renderer, surface)
+        self.uploads += 1
+        entry = (texture, drawrect)
+        self.textures[object] = entry
+        return entry
+
+    def invalidateObject(self, object):
+        self.stale[object] = None
+
+    def removeObject(self, object):
+        self.textures.pop(object, None)
+        self.stale.pop(object, None)
+
+# returns a TextureBackend drawing to the window, or the software backend when SDL's render API isn't available,
+# the window can't get an accelerated renderer, or pygame is running on the dummy driver
+# window: pygame._sdl2.video.Window
+# -> TextureBackend or SoftwareBackend
+def createBackend(window, bgcolor = (255,255,255), accelerated = True):
+    if video is None or pygame.display.get_driver() == "dummy":
+        return softwarebackend
+    try:
+        renderer = video.Renderer(window, accelerated=1 if accelerated else -1)
+    except (pygame.error, RuntimeError):
+        # SDL's errors from the render API are RuntimeErrors
+        return softwarebackend
+    return TextureBackend(renderer, bgcolor)
+
 
 #############
 ## Classes ##
@@ -66,16 +1234,38 @@ def multilineFontRender(font, text, antialiased, textcolor, bgcolor, spacing=1.1
 
 # base ui object
 # if used, draws a solid magenta rectangle
+# UI objects use __slots__ to keep them small, subclasses that don't declare __slots__ still get a __dict__
 class UIObject:
+    __slots__ = (
+        "rect", "onUpdate", "groups", "subpixel", "updatemode", "updateinterval", "pendingupdate", "lastupdate",
+        "updatetask", "cancelupdates"
+    )
+
+    # the pygame event types handleEvent cares about, groups only send these to the object.
+    # None means every event, which is what subclasses get unless they say otherwise.
+    eventtypes = None
+
     # initialization see handleEvent for use of onUpdate
-    # rect: int[4]
+    # rect: int[4] or pygame.Rect
     # color: int[3] or pygame.color
     # onUpdate: function
     def __init__(self, rect, onUpdate = None):
-        self.rect = rect
+        self.rect = pygame.Rect(rect)
+        # the fractional part of the position, so that moving by less than a pixel at a time still adds up
+        self.subpixel = (0, 0)
         self.onUpdate = onUpdate
-        all_objects.addObject(self)
-        
+        self.groups = []
+
+        # see setUpdateMode
+        self.updatemode = "immediate"
+        self.updateinterval = 0
+        self.pendingupdate = None   # the arguments of the latest undelivered onUpdate call
+        self.lastupdate = -math.inf
+        self.updatetask = None      # the asyncio task running the latest coroutine onUpdate call
+        self.cancelupdates = False
+
+        (all_objects if targetgroup is None else targetgroup).addObject(self)
+
     
     # draws the object onto the given surface and returns that surface
     # surface: pygame.Surface
@@ -91,19 +1281,33 @@ class UIObject:
         pass
     
     # moves the uiobject by a certain amount
-    # drect: int[4]
+    # dpos: float[2]
     def move(self, dpos):
-        self.rect = [self.rect[0]+dpos[0],self.rect[1]+dpos[1],self.rect[2],self.rect[3]]
+        x = self.rect.x + self.subpixel[0] + dpos[0]
+        y = self.rect.y + self.subpixel[1] + dpos[1]
+        self.rect.x = math.floor(x)
+        self.rect.y = math.floor(y)
+        self.subpixel = (x - self.rect.x, y - self.rect.y)
+        self.rectChanged()
 
     # moves the uiobject to a new location. put None in the list to keep something the same
     # newrect: int[4]
     def setRect(self, newrect):
-        for i in range(4):
-            if newrect[i] is not None:
-                self.rect[i] = newrect[i]
-
-    # gets the current rectangle
-    # -> int[4]
+        x, y, w, h = newrect
+        if x is not None:
+            self.rect.x = math.floor(x)
+            self.subpixel = (x - self.rect.x, self.subpixel[1])
+        if y is not None:
+            self.rect.y = math.floor(y)
+            self.subpixel = (self.subpixel[0], y - self.rect.y)
+        if w is not None:
+            self.rect.w = w
+        if h is not None:
+            self.rect.h = h
+        self.rectChanged()
+
+    # gets the current rectangle. This is the object's own rect, so use move or setRect to change it.
+    # -> pygame.Rect
     def getRect(self):
         return self.rect
 
@@ -112,92 +1316,787 @@ class UIObject:
     def getState(self):
         return None
 
+    # calls onUpdate with the given arguments, if there is one. Unless the object is in immediate mode the call
+    # is held back until its groups deliver it, only keeping the latest arguments.
+    def callUpdate(self, *args):
+        if self.onUpdate is None:
+            return
+        if self.updatemode == "immediate":
+            self.deliverUpdate(args, activeprofiler)
+            return
+        self.pendingupdate = args
+        for group in self.groups:
+            group.addPending(self)
+
+    # calls onUpdate now. If onUpdate is a coroutine function the coroutine is run as a task on the running
+    # event loop (see AsyncRunner), and the object shows that it is pending until the task finishes. Without a
+    # running event loop a coroutine onUpdate raises a RuntimeError.
+    # args: tuple
+    # profiler: Profiler or None
+    def deliverUpdate(self, args, profiler = None):
+        self.pendingupdate = None
+        self.lastupdate = time.perf_counter()
+        if profiler is None:
+            result = self.onUpdate(*args)
+        else:
+            result = profiler.profileUpdate(self, args)
+        if asyncio.iscoroutine(result):
+            self.startUpdateTask(result)
+
+    # runs a coroutine returned by onUpdate
+    # coroutine: coroutine
+    def startUpdateTask(self, coroutine):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # running it here would block the UI until it finished
+            coroutine.close()
+            raise RuntimeError(
+                "onUpdate of %s returned a coroutine outside of a running event loop, drive the UI with "
+                "AsyncRunner or from a coroutine" % type(self).__name__
+            ) from None
+
+        if self.updatetask is not None and self.cancelupdates:
+            self.updatetask.cancel()
+        wasrunning = self.updatetask is not None
+        self.updatetask = loop.create_task(coroutine)
+        self.updatetask.add_done_callback(self.updateTaskDone)
+        if not wasrunning:
+            self.invalidate()
+
+    # called when an onUpdate task finishes
+    # task: asyncio.Task
+    def updateTaskDone(self, task):
+        if task is self.updatetask:
+            self.updatetask = None
+            self.invalidate()
+        if not task.cancelled() and task.exception() is not None:
+            # lets the event loop's exception handler report it
+            raise task.exception()
+
+    # -> bool, whether an onUpdate task is still running
+    def isPending(self):
+        return self.updatetask is not None
+
+    # marks the object as waiting for its onUpdate task, drawn over the object by its groups
+    # surface: pygame.Surface
+    def drawPending(self, surface):
+        radius = max(min(self.rect[2], self.rect[3])//6, 2)
+        pygame.draw.circle(
+            surface,
+            (96,96,96),
+            (self.rect[0] + self.rect[2] - radius - 1, self.rect[1] + radius + 1),
+            radius,
+            width = max(radius//3, 1)
+        )
+
+    # sets when onUpdate is called
+    #   "immediate": every time the state changes (the default)
+    #   "frame": at most once per UIObjectGroup.flushUpdates, and at most once per interval seconds, with the latest state
+    #   "commit": only when the change is finished, on mouse up or when the object loses focus
+    # cancelsuperseded cancels a coroutine onUpdate that is still running when the next call is made
+    # mode: str
+    # interval: float
+    # cancelsuperseded: bool
+    def setUpdateMode(self, mode, interval = 0, cancelsuperseded = False):
+        if mode not in ("immediate", "frame", "commit"):
+            raise ValueError("unknown update mode: " + str(mode))
+        self.updatemode = mode
+        self.updateinterval = interval
+        self.cancelupdates = cancelsuperseded
+        if mode == "immediate" and self.pendingupdate is not None:
+            self.deliverUpdate(self.pendingupdate)
+
+    # -> bool
+    def hasPendingUpdate(self):
+        return self.pendingupdate is not None
+
     # resets the state of the UI object. e.g. clearing a text box.
     def reset(self):
         pass
 
+    # returns what draw() would do as a list of (surface, position, area) for Surface.blits, so that groups in
+    # batched mode can draw many objects at once. Returns None if the object has to be drawn with draw().
+    # atlas: WidgetAtlas
+    # clip: pygame.Rect, the area of the target being drawn
+    # -> list or None
+    def getBlits(self, atlas, clip):
+        return None
+
+    # returns the area that draw() paints on, used by retained mode to know what to redraw
+    # -> pygame.Rect
+    def getDrawRect(self):
+        return self.rect.copy()
+
+    # tells every group containing this object that it needs to be redrawn.
+    # should be called whenever something that affects how the object looks changes.
+    def invalidate(self):
+        for g in self.groups:
+            g.invalidateObject(self)
+
+    # tells every group containing this object that its rect has changed so they can update their spatial index.
+    # move and setRect call this, anything that assigns self.rect directly should too.
+    def rectChanged(self):
+        for g in self.groups:
+            g.updateObject(self)
+        self.invalidate()
+
+    # whether the object should keep receiving mouse events while the pointer is outside its rect, e.g. while dragging
+    # -> bool
+    def hasCapture(self):
+        return False
+
+    # whether the object should receive keyboard events
+    # -> bool
+    def hasFocus(self):
+        return False
+
+    # gives or takes away keyboard focus. Objects that can't be focused ignore this.
+    # focused: bool
+    def setFocus(self, focused):
+        pass
+
+    # returns the event types that groups should send to this object, or None for all of them
+    # -> int[] or None
+    def getEventTypes(self):
+        # a plain UIObject (or a subclass that doesn't override handleEvent) doesn't need any events
+        if type(self).handleEvent is UIObject.handleEvent:
+            return ()
+        return self.eventtypes
+
 # a helpful way to group UIObjects, almost all of these functions just call the same functions on the members
+# in retained mode (see setRetained) the group only redraws the areas of objects that have been invalidated
+# events are only sent to objects that subscribe to their type (see UIObject.eventtypes). On top of that,
+# mouse events only go to the objects under the pointer (plus the ones that were under it last time, the capture
+# owner and the focus owner), and keyboard events only go to the single focus owner.
 class UIObjectGroup:
     def __init__(self, objects = None):
         if objects is None:
             self.objects = []
         else:
             self.objects = objects
+
+        # event routing state
+        self.index = SpatialGrid()
+        self.order = {}         # object -> insertion number, so routed events keep the group's order
+        self.nextorder = 0
+        self.subscribers = {}   # event type -> objects subscribed to it, dicts are used as ordered sets
+        self.allsubscribers = {}    # objects with eventtypes = None
+        self.hovered = []
+        self.capture = None
+        self.focus = None
+
+        for o in self.objects:
+            self.registerObject(o)
+
+        # retained mode state
+        self.retained = False
+        self.bgcolor = None
+        self.backbuffer = None
+        self.dirtyobjects = {}  # used as an ordered set
+        self.dirtyrects = []
+        self.drawnrects = {}
+        self.drawindex = SpatialGrid()
+        self.exposed = False
+
+        self.profiler = None
+        self.atlas = None
+        self.backend = softwarebackend
+
+        # objects that may have an onUpdate call waiting, used as an ordered set
+        self.pendingupdates = {}
+
+        # the Panel this group belongs to, if any. It is told whenever an object is invalidated
+        self.owner = None
     
     # adds an object to the group
     # object: UIObject
     def addObject(self, object):
         self.objects.append(object)
+        self.registerObject(object)
+        self.invalidateObject(object)
+
+    # sets up the routing information for an object that was just put in self.objects
+    # object: UIObject
+    def registerObject(self, object):
+        object.groups.append(self)
+        self.order[object] = self.nextorder
+        self.nextorder += 1
+        self.index.insert(object, object.rect)
+
+        eventtypes = object.getEventTypes()
+        if eventtypes is None:
+            self.allsubscribers[object] = None
+        else:
+            for eventtype in eventtypes:
+                self.subscribers.setdefault(eventtype, {})[object] = None
     
     # removes an object from the group
     # object: UIObject
     def removeObject(self, object):
         self.objects.remove(object)
+        object.groups.remove(self)
+        del self.order[object]
+        self.index.remove(object)
+
+        self.allsubscribers.pop(object, None)
+        for subscribed in self.subscribers.values():
+            subscribed.pop(object, None)
+        if object in self.hovered:
+            self.hovered.remove(object)
+        if self.capture is object:
+            self.capture = None
+        if self.focus is object:
+            self.focus = None
+
+        self.backend.removeObject(object)
+        self.pendingupdates.pop(object, None)
+        self.dirtyobjects.pop(object, None)
+        self.drawindex.remove(object)
+        if object in self.drawnrects:
+            self.dirtyrects.append(self.drawnrects.pop(object))
     
     # returns a list of the objects in this group.
-    # This list is mutable, but it is advised to use addObject and removeObject instead.
+    # This list is mutable, but it is advised to use addObject and removeObject instead,
+    # otherwise the spatial index will not know about the change.
     # -> UIObject[]
     def getObjects(self):
         return self.objects
+
+    # updates the spatial index after an object's rect changes. This is usually called through UIObject.rectChanged
+    # object: UIObject
+    def updateObject(self, object):
+        self.index.insert(object, object.rect)
+
+    # returns the objects whose rect contains the point, in the group's order
+    # pos: int[2]
+    # -> UIObject[]
+    def getObjectsAt(self, pos):
+        found = [o for o in self.index.queryPoint(pos) if o.rect.collidepoint(pos)]
+        found.sort(key=self.order.__getitem__)
+        return found
+
+    # whether an object receives events of the given type
+    # object: UIObject
+    # eventtype: int
+    # -> bool
+    def isSubscribed(self, object, eventtype):
+        return object in self.allsubscribers or object in self.subscribers.get(eventtype, ())
+
+    # gives keyboard focus to an object, taking it from the previous owner. None clears the focus.
+    # object: UIObject or None
+    def setFocus(self, object):
+        if object is self.focus:
+            return
+        if self.focus is not None:
+            self.focus.setFocus(False)
+            self.commitUpdate(self.focus)
+        self.focus = object
+        if object is not None:
+            object.setFocus(True)
+
+    # returns the object that keyboard events are sent to, if any
+    # -> UIObject or None
+    def getFocus(self):
+        return self.focus
+
+    # returns the object that keeps receiving mouse events wherever the pointer is, if any
+    # -> UIObject or None
+    def getCapture(self):
+        return self.capture
     
-    def draw(self, surface):
+    # turns retained mode on or off.
+    # In retained mode the group keeps its own backbuffer and draw() only repaints the areas of invalidated
+    # objects, copying them onto the target surface. The target is not cleared, so it should not be
+    # filled between draws. If bgcolor is None the backbuffer is transparent and the caller is responsible
+    # for whatever is beneath the returned rects.
+    # retained: bool
+    # bgcolor: int[3] or pygame.color or None
+    def setRetained(self, retained, bgcolor = (255,255,255)):
+        self.retained = retained
+        self.bgcolor = None if bgcolor is None else pygame.Color(bgcolor)
+        self.backbuffer = None
+        self.dirtyobjects.clear()
+        self.dirtyrects = []
+        self.drawnrects = {}
+
+    # -> bool
+    def isRetained(self):
+        return self.retained
+
+    # tells a retained group that something else was drawn over its target, e.g. another scene, so the next draw
+    # copies the whole backbuffer to the target. Unlike invalidateAll no objects are redrawn.
+    def expose(self):
+        self.exposed = True
+
+    # forces the whole group to be redrawn on the next retained draw
+    def invalidateAll(self):
+        self.backbuffer = None
         for o in self.objects:
-            o.draw(surface)
+            self.backend.invalidateObject(o)
+
+    # marks an object as needing to be redrawn. This is usually called through UIObject.invalidate
+    # object: UIObject
+    def invalidateObject(self, object):
+        self.backend.invalidateObject(object)
+        if self.retained:
+            self.dirtyobjects[object] = None
+        if self.owner is not None:
+            self.owner.invalidate()
+
+    # attaches a Profiler to record draw, event and onUpdate timings. None turns profiling off,
+    # in which case the only cost is a check per object.
+    # profiler: Profiler or None
+    def setProfiler(self, profiler):
+        self.profiler = profiler
+
+    # -> Profiler or None
+    def getProfiler(self):
+        return self.profiler
+
+    # turns batched drawing on or off. When batched, objects that support it (see UIObject.getBlits) give the
+    # group a list of blits instead of drawing themselves, with backgrounds coming from the atlas, and the group
+    # draws runs of them with a single Surface.blits call. Objects that don't support it are drawn normally, in order.
+    # batched: bool
+    # atlas: WidgetAtlas, defaults to the shared widgetatlas
+    def setBatched(self, batched, atlas = None):
+        if batched:
+            self.atlas = widgetatlas if atlas is None else atlas
+        else:
+            self.atlas = None
+        self.invalidateAll()
+
+    # draws the objects onto the surface, in order
+    # surface: pygame.Surface
+    # objects: UIObject[]
+    def drawObjects(self, surface, objects):
+        profiler = self.profiler
+        if self.atlas is None:
+            for o in objects:
+                if profiler is None:
+                    o.draw(surface)
+                else:
+                    profiler.profileDraw(o, surface)
+                if o.updatetask is not None:
+                    o.drawPending(surface)
+            return
+
+        clip = surface.get_clip()
+        batch = []
+        for o in objects:
+            if o.updatetask is not None:
+                blits = None
+            elif profiler is None:
+                blits = o.getBlits(self.atlas, clip)
+            else:
+                blits = profiler.profileBlits(o, self.atlas, clip)
+            if blits is not None:
+                batch.extend(blits)
+                continue
+
+            if batch:
+                surface.blits(batch, doreturn=False)
+                batch = []
+            if profiler is None:
+                o.draw(surface)
+            else:
+                profiler.profileDraw(o, surface)
+            if o.updatetask is not None:
+                o.drawPending(surface)
+        if batch:
+            surface.blits(batch, doreturn=False)
+
+    # draws the objects onto the surface and returns the list of rects that changed.
+    # the result can be passed directly to pygame.display.update
+    # surface: pygame.Surface
+    # -> pygame.Rect[]
+    def draw(self, surface):
+        if textrasterizer.finished:
+            textrasterizer.collect()
+        if self.profiler is not None:
+            return self.profiler.profileFrame(self, surface)
+        return self.drawFrame(surface)
+
+    # sets what draws the group, see SoftwareBackend, TextureBackend and createBackend
+    # backend: render backend, None for the software one
+    def setBackend(self, backend):
+        self.backend = softwarebackend if backend is None else backend
+        self.invalidateAll()
+
+    # -> render backend
+    def getBackend(self):
+        return self.backend
+
+    # does the work of draw
+    def drawFrame(self, surface):
+        return self.backend.render(self, surface)
+
+    # draws with the software backend
+    def drawSoftware(self, surface):
+        if not self.retained:
+            self.drawObjects(surface, self.objects)
+            return [surface.get_rect()]
+
+        regions = self.updateBackbuffer(surface.get_size())
+        if self.exposed:
+            self.exposed = False
+            surface.blit(self.backbuffer, (0, 0))
+            return [self.backbuffer.get_rect()]
+        for region in regions:
+            surface.blit(self.backbuffer, region, region)
+        return regions
+
+    # brings a retained group's backbuffer up to date without copying it anywhere. Used by LayerStack, which
+    # composites the backbuffers of its layers itself.
+    # size: int[2], the size of the target
+    # -> pygame.Rect[], the parts of the backbuffer that changed
+    def updateBackbuffer(self, size):
+        if self.backbuffer is None or self.backbuffer.get_size() != tuple(size):
+            if self.bgcolor is None:
+                self.backbuffer = newSurface(size, pygame.SRCALPHA)
+            else:
+                self.backbuffer = newSurface(size)
+            self.dirtyobjects.clear()
+            self.drawnrects = {o: o.getDrawRect() for o in self.objects}
+            self.drawindex.clear()
+            for o, drawnrect in self.drawnrects.items():
+                self.drawindex.insert(o, drawnrect)
+            regions = [self.backbuffer.get_rect()]
+        else:
+            # both where the object was and where it is now need repainting
+            regions = self.dirtyrects
+            for o in self.dirtyobjects:
+                if o in self.drawnrects:
+                    regions.append(self.drawnrects[o])
+                self.drawnrects[o] = o.getDrawRect()
+                self.drawindex.insert(o, self.drawnrects[o])
+                regions.append(self.drawnrects[o])
+            self.dirtyobjects.clear()
+        self.dirtyrects = []
+
+        bounds = self.backbuffer.get_rect()
+        regions = [r.clip(bounds) for r in mergeRects(regions)]
+        regions = [r for r in regions if r.width > 0 and r.height > 0]
+
+        for region in regions:
+            self.backbuffer.set_clip(region)
+            self.backbuffer.fill((0,0,0,0) if self.bgcolor is None else self.bgcolor, region)
+            self.drawObjects(
+                self.backbuffer,
+                [o for o in sorted(self.drawindex.queryRect(region), key=self.order.__getitem__) if self.drawnrects[o].colliderect(region)]
+            )
+        self.backbuffer.set_clip(None)
+        return regions
+
+    # handles a whole frame's events, e.g. pygame.event.get(), merging motion events that nothing would
+    # see (see coalesceEvents) and returning how many were merged away
+    # events: pygame.event.Event[]
+    # -> int
+    def handleEvents(self, events):
+        events, coalesced = coalesceEvents(events)
+        for event in events:
+            self.handleEvent(event)
+        return coalesced
 
     def handleEvent(self, event):
-        for o in self.objects:
-            o.handleEvent(event)
+        if self.profiler is not None:
+            self.profiler.profileEvents(self, event)
+        else:
+            self.routeEvent(event)
+
+    # does the work of handleEvent, sending the event to the objects that should get it
+    def routeEvent(self, event):
+        profiler = self.profiler
+        eventtype = event.type
+        if eventtype in MOUSEEVENTS:
+            underpointer = self.getObjectsAt(event.pos)
+            recipients = dict.fromkeys(underpointer)
+            for o in self.hovered:
+                recipients[o] = None
+            for o in [self.capture, self.focus]:
+                if o is not None:
+                    recipients[o] = None
+            recipients = sorted(
+                [o for o in recipients if self.isSubscribed(o, eventtype)],
+                key=self.order.__getitem__
+            )
+            for o in recipients:
+                if profiler is None:
+                    o.handleEvent(event)
+                else:
+                    profiler.profileEvent(o, event)
+
+            self.hovered = underpointer
+            # objects can only have gained capture or focus if they were sent the event
+            self.updateOwners(recipients)
+            if eventtype == pygame.MOUSEBUTTONUP:
+                self.commitUpdates()
+
+        elif eventtype in KEYBOARDEVENTS:
+            recipients = list(self.allsubscribers)
+            if self.focus is not None and self.focus not in self.allsubscribers and self.isSubscribed(self.focus, eventtype):
+                recipients.append(self.focus)
+                recipients.sort(key=self.order.__getitem__)
+            for o in recipients:
+                if profiler is None:
+                    o.handleEvent(event)
+                else:
+                    profiler.profileEvent(o, event)
+            self.updateOwners(recipients)
+
+        else:
+            recipients = self.subscribers.get(eventtype, {})
+            if self.allsubscribers:
+                recipients = sorted(list(recipients) + list(self.allsubscribers), key=self.order.__getitem__)
+            for o in list(recipients):
+                if profiler is None:
+                    o.handleEvent(event)
+                else:
+                    profiler.profileEvent(o, event)
+
+    # notes that an object has an onUpdate call waiting. Groups inside a Panel pass it on to the Panel's groups
+    # so that flushing the outer group delivers it too. This is usually called through UIObject.callUpdate
+    # object: UIObject
+    def addPending(self, object):
+        self.pendingupdates[object] = None
+        if self.owner is not None:
+            for group in self.owner.groups:
+                group.addPending(object)
+
+    # delivers the onUpdate calls that objects in "frame" mode have been holding back, at most one per object.
+    # Call it once per frame, e.g. after handling events. Objects whose interval hasn't passed keep theirs.
+    # -> int, the number of calls delivered
+    def flushUpdates(self):
+        now = time.perf_counter()
+        delivered = 0
+        for o in list(self.pendingupdates):
+            if o.pendingupdate is None:
+                # delivered through another group
+                del self.pendingupdates[o]
+            elif o.updatemode != "commit" and now - o.lastupdate >= o.updateinterval:
+                del self.pendingupdates[o]
+                o.deliverUpdate(o.pendingupdate, self.profiler)
+                delivered += 1
+        return delivered
+
+    # delivers the waiting onUpdate calls of objects in "commit" mode when the mouse is released. Objects that have
+    # focus, like a Textfield being clicked in, keep theirs until they lose it.
+    def commitUpdates(self):
+        for o in list(self.pendingupdates):
+            if o.updatemode == "commit" and not o.hasFocus():
+                self.commitUpdate(o)
+
+    # delivers an object's waiting onUpdate call if it is in "commit" mode
+    # object: UIObject
+    def commitUpdate(self, object):
+        if object.updatemode == "commit" and object.pendingupdate is not None:
+            self.pendingupdates.pop(object, None)
+            object.deliverUpdate(object.pendingupdate, self.profiler)
+
+    # updates the capture and focus owners after the recipients of an event may have changed their state
+    # recipients: UIObject[]
+    def updateOwners(self, recipients):
+        if self.capture is not None and not self.capture.hasCapture():
+            self.capture = None
+        if self.focus is not None and not self.focus.hasFocus():
+            self.commitUpdate(self.focus)
+            self.focus = None
+
+        for o in recipients:
+            if o not in self.order:
+                # removed while handling the event
+                continue
+            if self.capture is None and o.hasCapture():
+                self.capture = o
+            if o is not self.focus and o.hasFocus():
+                self.setFocus(o)
 
     def reset(self):
         for o in self.objects:
             o.reset()
 
 # a box containing text. Due to the way that pygame's fonts work, this currently does not support newlines.
-# also note that the width and height of the rect will be ignored, instead only using the corner to place text.
+# also note that the height of the rect will be ignored, and so will the width unless wrap is set, instead only using
+# the corner to place text.
 # onUpdate is ignored
+# with threaded=True the text is laid out and rendered by textrasterizer, and the last finished text is shown meanwhile
+# with wrap set to one of WRAPMODES the text is wrapped to the width of the rect
 class Textbox(UIObject):
-    def __init__(self, rect, textcolor = (0,0,0), bgcolor = None, text = "", fontname = "sfns", fontsize = 12, spacing = 1.15, onUpdate = None):
+    __slots__ = (
+        "text", "spacing", "textcolor", "bgcolor", "font", "layout", "layoutkey", "threaded", "job", "jobkey", "rendered",
+        "wrap"
+    )
+    eventtypes = ()
+
+    def __init__(self, rect, textcolor = (0,0,0), bgcolor = None, text = "", fontname = "sfns", fontsize = 12, spacing = 1.15, onUpdate = None, threaded = False, wrap = None):
         super().__init__(rect,onUpdate)
         self.text = text
         self.spacing = spacing
+        self.wrap = wrap
 
-        self.textcolor = pygame.Color(textcolor)
-        self.bgcolor = None if bgcolor is None else pygame.Color(bgcolor)
+        self.textcolor = paletteColor(textcolor)
+        self.bgcolor = None if bgcolor is None else paletteColor(bgcolor)
 
         self.font = getFont(fontname, fontsize)
 
+        # the line layout is cached and only recalculated when something it depends on changes.
+        # the lines themselves are rendered through the shared render cache, and only if they are visible.
+        self.layout = None
+        self.layoutkey = None
+
+        self.threaded = threaded
+        self.job = None         # the textrasterizer job for jobkey
+        self.jobkey = None
+        self.rendered = None    # the surface of the last finished job
+        if threaded:
+            self.startJob()
+
+    # only draws the lines that are inside the surface's clip area
     def draw(self, surface):
-        # textsurface = self.font.render(self.text, True, self.textcolor, self.bgcolor)
-        textsurface = multilineFontRender(self.font, self.text, True, self.textcolor, self.bgcolor, self.spacing)
-        surface.blit(textsurface, self.rect)
+        if self.threaded:
+            if self.rendered is not None:
+                surface.blit(self.rendered, self.rect.topleft)
+            return
+
+        lines, lineys, size = self.getLayout()
+        clip = surface.get_clip()
+        top = clip.top - self.rect[1]
+        bottom = clip.bottom - self.rect[1]
+
+        for row in range(max(bisect.bisect_right(lineys, top) - 1, 0), len(lines)):
+            y = int(lineys[row])
+            if y >= bottom:
+                break
+            surface.blit(
+                renderLine(self.font, lines[row], True, self.textcolor, self.bgcolor),
+                (self.rect[0], self.rect[1] + y)
+            )
+
+    def getBlits(self, atlas, clip):
+        if self.threaded:
+            return [] if self.rendered is None else [(self.rendered, self.rect.topleft, None)]
+
+        lines, lineys, size = self.getLayout()
+        top = clip.top - self.rect[1]
+        bottom = clip.bottom - self.rect[1]
+
+        blits = []
+        for row in range(max(bisect.bisect_right(lineys, top) - 1, 0), len(lines)):
+            y = int(lineys[row])
+            if y >= bottom:
+                break
+            blits.append((
+                renderLine(self.font, lines[row], True, self.textcolor, self.bgcolor),
+                (self.rect[0], self.rect[1] + y),
+                None
+            ))
+        return blits
+
+    def getDrawRect(self):
+        if self.threaded:
+            return pygame.Rect(self.rect.topleft, (0, 0) if self.rendered is None else self.rendered.get_size())
+        return pygame.Rect((self.rect[0], self.rect[1]), self.getLayout()[2])
+
+    # changes the displayed text. The layout is recalculated on the next draw.
+    # text: str
+    def setText(self, text):
+        self.text = text
+        self.layout = None
+        if self.threaded:
+            self.startJob()
+        else:
+            self.invalidate()
+
+    # renders the current text on textrasterizer, replacing any job that hasn't finished
+    def startJob(self):
+        key = self.getLayoutKey() + (self.textcolor, self.bgcolor)
+        if key == self.jobkey:
+            return
+        if self.job is not None:
+            self.job.cancel()
+        self.jobkey = key
+        # wrapping is cheap and cached, so it stays on this thread
+        self.job = textrasterizer.submit(self, self.font, "\n".join(self.getLines()), self.textcolor, self.bgcolor, self.spacing)
+
+    # called by textrasterizer when a job has finished
+    def textReady(self):
+        job = self.job
+        if job is None or not job.done() or job.cancelled():
+            # an older job, the current one will call again
+            return
+        lines, lineys, surface = job.result()
+        self.job = None
+        self.layout = (lines, lineys, surface.get_size())
+        self.layoutkey = self.jobkey[:-2]
+        self.rendered = surface
+        self.invalidate()
+
+    # -> bool, whether the text shown is out of date because a threaded render hasn't finished
+    def isRendering(self):
+        return self.job is not None
+
+    # wrapped text has to be laid out again when the width changes
+    def rectChanged(self):
+        super().rectChanged()
+        if self.threaded and self.wrap is not None:
+            self.startJob()
+
+    # -> tuple, everything the layout depends on
+    def getLayoutKey(self):
+        return (self.text, self.font, self.spacing, self.wrap, self.rect[2] if self.wrap is not None else None)
+
+    # returns the lines of text, wrapped if wrap is set
+    # -> str[]
+    def getLines(self):
+        if self.wrap is None:
+            return self.text.split("\n")
+        return textwrapper.wrap(self.text, self.font, self.rect[2], self.wrap)
+
+    # returns the lines of text, the y position of each line and the size of the whole text,
+    # recalculating them if the text, font, spacing or wrapping have changed
+    # -> (str[], float[], (int, int))
+    def getLayout(self):
+        key = self.getLayoutKey()
+        if self.layout is None or key != self.layoutkey:
+            lines = self.getLines()
+            lineys = []
+            neededwidth = 0
+            accumheight = 0
+            for line in lines:
+                lineys.append(accumheight)
+                rendersize = self.font.size(line)
+                neededwidth = max(neededwidth, rendersize[0])
+                accumheight += rendersize[1] * self.spacing
+            self.layout = (lines, lineys, (neededwidth, int(accumheight)))
+            self.layoutkey = key
+        return self.layout
 
 # similar to a textbox, but will change color when hovered over and activates the onUpdate() function when clicked.
 # notably, unlike the other UIObjects, it does not pass anything to onUpdate
 class Button(UIObject):
+    __slots__ = ("text", "textcolor", "bgcolor", "bgcolor1", "bgcolor2", "bgcolor3", "font", "textsurface", "textkey")
+    eventtypes = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+
     def __init__(self, rect, textcolor=(0,0,0), bgcolor=(192,192,192), bgcolor2=None, bgcolor3=None, text = "", fontname = "sfns", fontsize = 12, onUpdate = None):
         super().__init__(rect,onUpdate)
         self.text = text
-        self.textcolor = pygame.Color(textcolor)
+        self.textcolor = paletteColor(textcolor)
 
         # self.bgcolor is the active one
         # self.bgcolor1 is when not hovered over
         # self.bgcolor2 is when hovered over
         # self.bgcolor3 is when clicked
-        self.bgcolor1 = pygame.Color(bgcolor)
+        self.bgcolor1 = paletteColor(bgcolor)
 
         if bgcolor2 is None:
-            self.bgcolor2 = copy.deepcopy(self.bgcolor1)
-            oldhsva = self.bgcolor2.hsva
-            self.bgcolor2.hsva = (oldhsva[0],oldhsva[1],oldhsva[2]*0.9,oldhsva[3])
+            self.bgcolor2 = paletteColor(self.bgcolor1, 0.9)
         else:
-            self.bgcolor2 = bgcolor2
+            self.bgcolor2 = paletteColor(bgcolor2)
 
         if bgcolor3 is None:
-            self.bgcolor3 = copy.deepcopy(self.bgcolor1)
-            oldhsva = self.bgcolor3.hsva
-            self.bgcolor3.hsva = (oldhsva[0],oldhsva[1],oldhsva[2]*0.8,oldhsva[3])
+            self.bgcolor3 = paletteColor(self.bgcolor1, 0.8)
         else:
-            self.bgcolor3 = bgcolor3
+            self.bgcolor3 = paletteColor(bgcolor3)
 
         self.bgcolor = self.bgcolor1
 
@@ -207,6 +2106,10 @@ class Button(UIObject):
             fontsize = 12
         self.font = getFont(fontname, fontsize)
 
+        # the text is prerendered and only rerendered when something it depends on changes
+        self.textsurface = None
+        self.textkey = None
+
     def draw(self, surface):
         pygame.draw.rect(
             surface,
@@ -214,7 +2117,7 @@ class Button(UIObject):
             self.rect,
             border_radius=min(self.rect[2],self.rect[3])//3
         )
-        textsurface = multilineFontRender(self.font, self.text, True, self.textcolor, self.bgcolor)
+        textsurface = self.getTextSurface()
         blitrect = [
            self.rect[0] + ((self.rect[2]-textsurface.get_width())//2),
            self.rect[1] + ((self.rect[3]-textsurface.get_height())//2),
@@ -222,34 +2125,74 @@ class Button(UIObject):
            0]
         surface.blit(textsurface, blitrect)
 
+    def getBlits(self, atlas, clip):
+        background, area = atlas.getBackground(self.rect.size, self.bgcolor, min(self.rect[2],self.rect[3])//3)
+        textsurface = self.getTextSurface()
+        return [
+            (background, self.rect.topleft, area),
+            (textsurface, (
+                self.rect[0] + ((self.rect[2]-textsurface.get_width())//2),
+                self.rect[1] + ((self.rect[3]-textsurface.get_height())//2)
+            ), None)
+        ]
+
+    def getDrawRect(self):
+        textsurface = self.getTextSurface()
+        return self.rect.union(textsurface.get_rect(center=self.rect.center))
+
     def handleEvent(self, event):
         # handle colors
         if event.type in [pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP]:
-            if not inRect(event.pos, self.rect):
+            oldbgcolor = self.bgcolor
+            if not self.rect.collidepoint(event.pos):
                 self.bgcolor = self.bgcolor1
             elif pygame.mouse.get_pressed()[0]:
                 self.bgcolor = self.bgcolor3
             else:
                 self.bgcolor = self.bgcolor2
+            if self.bgcolor is not oldbgcolor:
+                self.invalidate()
         
         # handle clicks
         if event.type == pygame.MOUSEBUTTONDOWN:
-            if inRect(event.pos, self.rect) and event.button == 1:
-                if self.onUpdate is not None:
-                    self.onUpdate()
+            if self.rect.collidepoint(event.pos) and event.button == 1:
+                self.callUpdate()
+
+    # changes the button's label. The prerendered text is rebuilt on the next draw.
+    # text: str
+    def setText(self, text):
+        self.text = text
+        self.textsurface = None
+        self.invalidate()
+
+    # returns the prerendered label, rerendering it if the text, colors or font have changed
+    # since the background is part of the key, each hover/click state change causes one rerender
+    # -> pygame.Surface
+    def getTextSurface(self):
+        key = (self.text, tuple(self.textcolor), tuple(self.bgcolor), self.font)
+        if self.textsurface is None or key != self.textkey:
+            self.textsurface = multilineFontRender(self.font, self.text, True, self.textcolor, self.bgcolor)
+            self.textkey = key
+        return self.textsurface
 
 # a line with a handle that slides between a given max and min
 # if discrete is true, the slider will snap to the nearest integer.
 # if false, it snaps to the nearest pixel.
 class Slider(UIObject):
+    __slots__ = (
+        "slidermin", "slidermax", "discrete", "linecolor", "handlecolor",
+        "linesize", "sliderdefault", "slidervalue", "clickedon"
+    )
+    eventtypes = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+
     def __init__(self, rect, slidermin, slidermax, discrete=True, sliderdefault=None, linecolor=(128,128,128), handlecolor=(192,192,192), linesize=None, onUpdate=None):
         super().__init__(rect, onUpdate)
         self.slidermin = slidermin
         self.slidermax = slidermax
         self.discrete = discrete
         
-        self.linecolor = pygame.Color(linecolor)
-        self.handlecolor = pygame.Color(handlecolor)
+        self.linecolor = paletteColor(linecolor)
+        self.handlecolor = paletteColor(handlecolor)
 
         self.linesize = rect[3]//3 if linesize is None else linesize
         self.sliderdefault = slidermin if sliderdefault is None else sliderdefault
@@ -282,10 +2225,14 @@ class Slider(UIObject):
         )
         return surface
 
+    # the handle hangs over the ends of the line by its radius
+    def getDrawRect(self):
+        return self.rect.inflate(2*(self.rect[3]//2) + 2, 0)
+
     def handleEvent(self, event):
         # handle self.clickedon
         if event.type == pygame.MOUSEBUTTONDOWN:
-            if inRect(event.pos, self.rect) and event.button == 1:
+            if self.rect.collidepoint(event.pos) and event.button == 1:
                 self.clickedon = True
         
         elif event.type == pygame.MOUSEBUTTONUP:
@@ -306,24 +2253,34 @@ class Slider(UIObject):
                 self.slidervalue = (sliderfrac * (self.slidermax - self.slidermin)) + self.slidermin
                 if self.discrete:
                     self.slidervalue = int(round(self.slidervalue))
+                self.invalidate()
 
                 # call onupdate
-                if self.onUpdate is not None:
-                    self.onUpdate(self.getState())
+                self.callUpdate(self.getState())
     
+    def hasCapture(self):
+        return self.clickedon
+
     def getState(self):
         return self.slidervalue
 
     def reset(self):
         self.slidervalue = self.sliderdefault
-        self.onUpdate(self.getState())
+        self.invalidate()
+        self.callUpdate(self.getState())
 
 # very similar to a button, but is toggled by clicking
 class Toggle(UIObject):
+    __slots__ = (
+        "text", "textcolor", "state", "bgcolor", "bgcolor1", "bgcolor2", "bgcolor3", "bgcolor4",
+        "font", "textsurface", "textkey"
+    )
+    eventtypes = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN)
+
     def __init__(self, rect, textcolor=(0,0,0), bgcolor=(192,192,192), bgcolor2=None, bgcolor3=None, bgcolor4=None, text = "", fontname = "sfns", fontsize = 12, onUpdate = None):
         super().__init__(rect,onUpdate)
         self.text = text
-        self.textcolor = pygame.Color(textcolor)
+        self.textcolor = paletteColor(textcolor)
 
         self.state = False
 
@@ -332,33 +2289,31 @@ class Toggle(UIObject):
         # self.bgcolor2 is when off, hovered over
         # self.bgcolor3 is when on
         # self.bgcolor4 is when on, hovered over
-        self.bgcolor1 = pygame.Color(bgcolor)
+        self.bgcolor1 = paletteColor(bgcolor)
 
         if bgcolor2 is None:
-            self.bgcolor2 = copy.deepcopy(self.bgcolor1)
-            oldhsva = self.bgcolor2.hsva
-            self.bgcolor2.hsva = (oldhsva[0],oldhsva[1],oldhsva[2]*0.9,oldhsva[3])
+            self.bgcolor2 = paletteColor(self.bgcolor1, 0.9)
         else:
-            self.bgcolor2 = bgcolor2
+            self.bgcolor2 = paletteColor(bgcolor2)
 
         if bgcolor3 is None:
-            self.bgcolor3 = copy.deepcopy(self.bgcolor1)
-            oldhsva = self.bgcolor3.hsva
-            self.bgcolor3.hsva = (oldhsva[0],oldhsva[1],oldhsva[2]*0.8,oldhsva[3])
+            self.bgcolor3 = paletteColor(self.bgcolor1, 0.8)
         else:
-            self.bgcolor3 = bgcolor3
+            self.bgcolor3 = paletteColor(bgcolor3)
         
         if bgcolor4 is None:
-            self.bgcolor4 = copy.deepcopy(self.bgcolor1)
-            oldhsva = self.bgcolor4.hsva
-            self.bgcolor4.hsva = (oldhsva[0],oldhsva[1],oldhsva[2]*0.7,oldhsva[3])
+            self.bgcolor4 = paletteColor(self.bgcolor1, 0.7)
         else:
-            self.bgcolor4 = bgcolor4
+            self.bgcolor4 = paletteColor(bgcolor4)
 
         self.bgcolor = self.bgcolor1
 
         self.font = getFont(fontname, fontsize)
 
+        # the text is prerendered and only rerendered when something it depends on changes
+        self.textsurface = None
+        self.textkey = None
+
     def draw(self, surface):
         pygame.draw.rect(
             surface,
@@ -366,8 +2321,7 @@ class Toggle(UIObject):
             self.rect,
             border_radius=min(self.rect[2],self.rect[3])//3
         )
-        textsurface = self.font.render(self.text, True, self.textcolor)
-        textsurface = self.font.render(self.text, True, self.textcolor, self.bgcolor)
+        textsurface = self.getTextSurface()
         blitrect = [
            self.rect[0] + ((self.rect[2]-textsurface.get_width())//2),
            self.rect[1] + ((self.rect[3]-textsurface.get_height())//2),
@@ -375,17 +2329,32 @@ class Toggle(UIObject):
            0]
         surface.blit(textsurface, blitrect)
 
+    def getBlits(self, atlas, clip):
+        background, area = atlas.getBackground(self.rect.size, self.bgcolor, min(self.rect[2],self.rect[3])//3)
+        textsurface = self.getTextSurface()
+        return [
+            (background, self.rect.topleft, area),
+            (textsurface, (
+                self.rect[0] + ((self.rect[2]-textsurface.get_width())//2),
+                self.rect[1] + ((self.rect[3]-textsurface.get_height())//2)
+            ), None)
+        ]
+
+    def getDrawRect(self):
+        textsurface = self.getTextSurface()
+        return self.rect.union(textsurface.get_rect(center=self.rect.center))
+
     def handleEvent(self, event):
         # handle clicks
         if event.type == pygame.MOUSEBUTTONDOWN:
-            if inRect(event.pos, self.rect) and event.button == 1:
+            if self.rect.collidepoint(event.pos) and event.button == 1:
                 self.state = not self.state
-                if self.onUpdate is not None:
-                    self.onUpdate(self.getState())
+                self.callUpdate(self.getState())
 
         # handle colors
         if event.type in [pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN]:
-            if inRect(event.pos, self.rect):
+            oldbgcolor = self.bgcolor
+            if self.rect.collidepoint(event.pos):
                 if self.state:
                     self.bgcolor = self.bgcolor4
                 else:
@@ -395,31 +2364,69 @@ class Toggle(UIObject):
                     self.bgcolor = self.bgcolor3
                 else:
                     self.bgcolor = self.bgcolor1
+            if self.bgcolor is not oldbgcolor:
+                self.invalidate()
     
+    # changes the toggle's label. The prerendered text is rebuilt on the next draw.
+    # text: str
+    def setText(self, text):
+        self.text = text
+        self.textsurface = None
+        self.invalidate()
+
+    # returns the prerendered label, rerendering it if the text, colors or font have changed
+    # -> pygame.Surface
+    def getTextSurface(self):
+        key = (self.text, tuple(self.textcolor), tuple(self.bgcolor), self.font)
+        if self.textsurface is None or key != self.textkey:
+            self.textsurface = renderLine(self.font, self.text, True, self.textcolor, self.bgcolor)
+            self.textkey = key
+        return self.textsurface
+
     def getState(self):
         return self.state
     
     def reset(self):
         self.state = False
+        self.invalidate()
 
 
 class Textfield(UIObject):
-    def __init__(self, rect, textcolor=(0,0,0), bgcolor=(192,192,192), bordercolor=(0,0,0), defaulttext = "", allownewlines=False, fontname = "sfns", fontsize = 12, spacing=1.15, padding=5, onUpdate=None):
+    __slots__ = (
+        "textcolor", "bgcolor", "bordercolor", "allownewlines", "infocus", "font", "padding", "spacing",
+        "defaulttext", "buffer", "textoffset", "lineys", "drawnrows", "clipsurface", "cursor", "cursorpos", "rcp",
+        "metrics", "wrap", "wrapwidth"
+    )
+    eventtypes = (pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN)
+
+    # wrap: None, or one of WRAPMODES to wrap lines to the width of the field
+    def __init__(self, rect, textcolor=(0,0,0), bgcolor=(192,192,192), bordercolor=(0,0,0), defaulttext = "", allownewlines=False, fontname = "sfns", fontsize = 12, spacing=1.15, padding=5, onUpdate=None, wrap=None):
         super().__init__(rect, onUpdate)
+        self.wrap = wrap
+        self.wrapwidth = rect[2] - padding
         self.textcolor = textcolor
         self.bgcolor = bgcolor
         self.bordercolor = bordercolor
         self.allownewlines = allownewlines
         self.infocus = False
         self.font = getFont(fontname, fontsize)
+        self.metrics = getMetrics(self.font)
         self.padding = padding
         self.spacing = spacing
 
         self.defaulttext = defaulttext
-        self.text = defaulttext
+        self.buffer = TextBuffer(defaulttext)
         self.textoffset = [0,0]
 
+        # the layout cache: the y position of each line, see getLineYs
+        self.lineys = []
+        # the rows that were drawn last time, only these keep their rendered surfaces
+        self.drawnrows = range(0)
+        # reused between draws so the text can be clipped to the box
+        self.clipsurface = None
+
         self.cursor = 0
+        self.cursorpos = (0, 0)
         self.rcp = self.getrelativecursorpos()
     
     def draw(self, surface):
@@ -437,9 +2444,24 @@ class Textfield(UIObject):
         )
 
         # text and cursor
-        textsurface = multilineFontRender(self.font, self.text, True, self.textcolor, None, self.spacing)
-        constrainedtextsurface = pygame.surface.Surface((self.rect[2]-self.padding, self.rect[3]-self.padding), pygame.SRCALPHA)
-        constrainedtextsurface.blit(textsurface, self.textoffset)
+        clipsize = (self.rect[2]-self.padding, self.rect[3]-self.padding)
+        if self.clipsurface is None or self.clipsurface.get_size() != clipsize:
+            self.clipsurface = newSurface(clipsize, pygame.SRCALPHA)
+        constrainedtextsurface = self.clipsurface
+        constrainedtextsurface.fill((0,0,0,0))
+
+        # only the lines that intersect the box are rendered and blitted
+        lineys = self.getLineYs()
+        offsety = int(self.textoffset[1])
+        firstrow = max(bisect.bisect_right(lineys, -offsety) - 1, 0)
+        row = firstrow
+        while row < len(lineys) and offsety + int(lineys[row]) < clipsize[1]:
+            constrainedtextsurface.blit(
+                self.getLineSurface(row),
+                (int(self.textoffset[0]), offsety + int(lineys[row]))
+            )
+            row += 1
+        self.dropLineSurfaces(range(firstrow, row))
 
         if self.infocus:
             cursorcoords = [self.textoffset[0] + self.rcp[0], self.textoffset[1] + self.rcp[1]]
@@ -458,103 +2480,210 @@ class Textfield(UIObject):
 
 
 
+    # the line cache holds (height, surface) for each line, where surface is None if the line hasn't been
+    # drawn since it was last visible. When wrapping, a line is all of its wrapped rows and height is their total
+
+    # returns where a line wraps, see TextWrapper.getBreaks. Lines that aren't wrapped have one row
+    # row: int
+    # -> (int, int)[]
+    def getLineBreaks(self, row):
+        line = self.buffer.getLine(row)
+        if self.wrap is None:
+            return [(0, len(line))]
+        return textwrapper.getBreaks(line, self.font, self.wrapwidth, self.wrap)
+
+    # returns the height of a line, only measuring it if it was edited
+    # row: int
+    # -> int
+    def getLineHeight(self, row):
+        layout = self.buffer.linecache[row]
+        if layout is None:
+            height = self.font.size(self.buffer.getLine(row))[1]
+            if self.wrap is not None:
+                height *= len(self.getLineBreaks(row))
+            layout = (height, None)
+            self.buffer.linecache[row] = layout
+        return layout[0]
+
+    # returns the height of one wrapped row of a line
+    # -> int
+    def getRowHeight(self, row):
+        return self.getLineHeight(row) // len(self.getLineBreaks(row))
+
+    # returns the rendered surface of a line, only rendering it if it was edited or scrolled back into view
+    # row: int
+    # -> pygame.Surface
+    def getLineSurface(self, row):
+        layout = self.buffer.linecache[row]
+        if layout is None or layout[1] is None:
+            line = self.buffer.getLine(row)
+            breaks = self.getLineBreaks(row)
+            if len(breaks) == 1:
+                surface = renderLine(self.font, line, True, self.textcolor)
+            else:
+                rowheight = self.getRowHeight(row)
+                surface = newSurface(
+                    (self.wrapwidth, int((len(breaks) - 1) * rowheight * self.spacing) + rowheight),
+                    pygame.SRCALPHA
+                )
+                surface.fill((0,0,0,0))
+                for i, (start, end) in enumerate(breaks):
+                    surface.blit(renderLine(self.font, line[start:end], True, self.textcolor), (0, int(i * rowheight * self.spacing)))
+            layout = (self.getLineHeight(row), surface)
+            self.buffer.linecache[row] = layout
+        return layout[1]
+
+    # forgets the surfaces of lines that were drawn last time but are no longer visible,
+    # so memory use depends on the size of the box rather than the length of the text
+    # visiblerows: range
+    def dropLineSurfaces(self, visiblerows):
+        linecache = self.buffer.linecache
+        for row in self.drawnrows:
+            if row not in visiblerows and row < len(linecache) and linecache[row] is not None:
+                linecache[row] = (linecache[row][0], None)
+        self.drawnrows = visiblerows
+
+    # returns the y position of every line relative to the top of the text.
+    # only the lines after the first edited one are recalculated, and only edited lines are remeasured.
+    # -> float[]
+    def getLineYs(self):
+        resized = self.wrap is not None and self.wrapwidth != self.rect[2] - self.padding
+        if resized:
+            # every line has to be wrapped again
+            self.wrapwidth = self.rect[2] - self.padding
+            self.buffer.linecache = [None] * self.buffer.getLineCount()
+            self.buffer.firstchanged = 0
+        firstchanged = self.buffer.firstchanged
+        if firstchanged is not None:
+            del self.lineys[firstchanged+1:]
+            accumheight = self.lineys[-1] if self.lineys else 0
+            if not self.lineys:
+                self.lineys.append(0)
+            for row in range(len(self.lineys)-1, self.buffer.getLineCount()-1):
+                accumheight += self.getLineHeight(row) * self.spacing
+                self.lineys.append(accumheight)
+            self.buffer.firstchanged = None
+        if resized:
+            # the cursor may be on a different wrapped row now
+            self.rcp = self.getrelativecursorpos()
+        return self.lineys
+
     # returns three values, xpos, ypos and height
     # getrelativecursorpos + textoffset should always be in the box
     def getrelativecursorpos(self, cursor=None):
         if cursor is None:
-            cursor = self.cursor
-        
-        subtext = self.text[0:cursor]
-        splittext = subtext.split("\n")
-        yoffset = 0
-        for line in splittext[:-1]:
-            yoffset += self.font.size(line)[1]*self.spacing
+            row, col = self.cursorpos
+        else:
+            row, col = self.buffer.toRowCol(cursor)
+
+        yoffset = self.getLineYs()[row]
+        line = self.buffer.getLine(row)
+        if self.wrap is None:
+            return (self.metrics.width(line, 0, col), yoffset, self.getLineHeight(row))
+
+        breaks = self.getLineBreaks(row)
+        wrappedrow = max(bisect.bisect_right(breaks, (col, math.inf)) - 1, 0)
+        rowheight = self.getRowHeight(row)
+        return (
+            self.metrics.width(line, breaks[wrappedrow][0], col),
+            yoffset + wrappedrow * rowheight * self.spacing,
+            rowheight
+        )
+
+    # returns the (row, column) of the character boundary closest to a point in the box
+    # pos: int[2], relative to the top left of the box
+    # -> (int, int)
+    def positionAt(self, pos):
+        x = pos[0] - self.padding//2 - self.textoffset[0]
+        y = pos[1] - self.padding//2 - self.textoffset[1]
+        lineys = self.getLineYs()
+        row = max(bisect.bisect_right(lineys, y) - 1, 0)
+        line = self.buffer.getLine(row)
+        if self.wrap is None:
+            return (row, self.metrics.indexAt(line, x))
+
+        breaks = self.getLineBreaks(row)
+        wrappedrow = min(max(int((y - lineys[row]) // (self.getRowHeight(row) * self.spacing)), 0), len(breaks) - 1)
+        start, end = breaks[wrappedrow]
+        return (row, start + self.metrics.indexAt(line[start:end], x))
+
+    # moves the cursor to a (row, column) position in the text
+    # row: int
+    # col: int
+    def setCursor(self, row, col):
+        self.cursorpos = (row, col)
+        self.cursor = self.buffer.toIndex(row, col)
+        self.rcp = self.getrelativecursorpos()
 
-        xoffset = self.font.size(splittext[-1])[0]
-        height = self.font.size(splittext[-1])[1]
+    # inserts text at the cursor and moves the cursor after it
+    # text: str
+    def insertText(self, text):
+        self.cursorpos = self.buffer.insert(*self.cursorpos, text)
+        self.cursor += len(text)
+        self.rcp = self.getrelativecursorpos()
 
-        return (xoffset, yoffset, height)
-        
 
     def handleEvent(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
-            if inRect(event.pos, self.rect):
+            wasinfocus = self.infocus
+            if self.rect.collidepoint(event.pos):
                 if event.button == 1:
                     self.infocus = True
+                    # clicking places the cursor
+                    self.setCursor(*self.positionAt((event.pos[0] - self.rect[0], event.pos[1] - self.rect[1])))
+                    self.invalidate()
             else:
                 self.infocus = False
+            if self.infocus != wasinfocus:
+                self.invalidate()
         elif event.type == pygame.KEYDOWN:
             if self.infocus:
+                self.invalidate()
                 # TODO: add command and option to backspace and arrow keys
                 # print(event)
                 if event.key == pygame.K_ESCAPE:
                     self.infocus = False
                 elif event.key == pygame.K_BACKSPACE:
                     if self.cursor > 0:
-                        nextcursor = 0 
                         if event.mod & 1024 or event.mod & 2048: # command
-                            for i in range(self.cursor-1, -1, -1):
-                                if self.text[i] == "\n":
-                                    nextcursor = i
-                                    break
+                            # deletes back to (and including) the previous line break
+                            nextcursor = self.buffer.findBackward(*self.cursorpos, "\n") or (0, 0)
                         elif event.mod & 256 or event.mod & 512: # option
-                            for i in range(self.cursor-2, -1, -1):
-                                if self.text[i] == "\n" or self.text[i] == " ":
-                                    nextcursor = i
-                                    break
+                            nextcursor = self.buffer.findBackward(*self.buffer.stepBack(*self.cursorpos), " \n") or (0, 0)
                         else:
-                            nextcursor = self.cursor - 1
-                        self.text = self.text[:nextcursor] + self.text[self.cursor:]
-                        self.cursor = nextcursor
-                        self.rcp = self.getrelativecursorpos()
+                            nextcursor = self.buffer.stepBack(*self.cursorpos)
+                        self.buffer.delete(*nextcursor, *self.cursorpos)
+                        self.setCursor(*nextcursor)
                 elif event.key == pygame.K_RIGHT:
-                    if self.cursor < len(self.text):
+                    if self.cursor < len(self.buffer):
                         if event.mod & 1024 or event.mod & 2048: # command
-                            nextcursor = len(self.text)
-                            for i in range(self.cursor, len(self.text)):
-                                if self.text[i] == "\n":
-                                    nextcursor = i
-                                    break
-                            self.cursor = nextcursor
+                            nextcursor = self.buffer.findForward(*self.cursorpos, "\n") or self.buffer.getEnd()
                         elif event.mod & 256 or event.mod & 512: # option
-                            nextcursor = len(self.text)
-                            for i in range(self.cursor+1, len(self.text)):
-                                if self.text[i] == "\n" or self.text[i] == " ":
-                                    nextcursor = i
-                                    break
-                            self.cursor = nextcursor
+                            nextcursor = self.buffer.findForward(*self.buffer.stepForward(*self.cursorpos), " \n") or self.buffer.getEnd()
                         else:
-                            self.cursor += 1
-                        self.rcp = self.getrelativecursorpos()
+                            nextcursor = self.buffer.stepForward(*self.cursorpos)
+                        self.setCursor(*nextcursor)
                 elif event.key == pygame.K_LEFT:
                     if self.cursor > 0:
                         if event.mod & 1024 or event.mod & 2048: # command
-                            nextcursor = 0
-                            for i in range(self.cursor-1, -1, -1):
-                                if self.text[i] == "\n":
-                                    nextcursor = i+1
-                                    break
-                            self.cursor = nextcursor
+                            found = self.buffer.findBackward(*self.cursorpos, "\n")
                         elif event.mod & 256 or event.mod & 512: # option
-                            nextcursor = 0
-                            for i in range(self.cursor-2, -1, -1):
-                                if self.text[i] == "\n" or self.text[i] == " ":
-                                    nextcursor = i+1
-                                    break
-                            self.cursor = nextcursor
+                            found = self.buffer.findBackward(*self.buffer.stepBack(*self.cursorpos), " \n")
                         else:
-                            self.cursor -= 1
-                        self.rcp = self.getrelativecursorpos()
+                            found = None
+                        if found is not None:
+                            nextcursor = self.buffer.stepForward(*found)
+                        elif event.mod & (1024 | 2048 | 256 | 512):
+                            nextcursor = (0, 0)
+                        else:
+                            nextcursor = self.buffer.stepBack(*self.cursorpos)
+                        self.setCursor(*nextcursor)
                 elif event.key == pygame.K_RETURN:
-                    self.text = self.text[:self.cursor] + "\n" + self.text[self.cursor:]
-                    self.cursor += 1
-                    self.rcp = self.getrelativecursorpos()
+                    self.insertText("\n")
                 elif event.key in [pygame.K_UP, pygame.K_DOWN]:
                     pass
                 else:
-                    self.text = self.text[:self.cursor] + event.unicode + self.text[self.cursor:]
-                    self.cursor += len(event.unicode)
-                    self.rcp = self.getrelativecursorpos()
+                    self.insertText(event.unicode)
                 
                 # horizontal textoffset
                 if self.textoffset[0] + self.rcp[0] < 0:
@@ -567,23 +2696,1083 @@ class Textfield(UIObject):
                 elif self.textoffset[1] + self.rcp[1] + self.rcp[2] >= self.rect[3]-self.padding:
                     self.textoffset[1] = self.rect[3]-self.padding-self.rcp[1]-self.rcp[2]
                 
-                if self.onUpdate is not None:
-                    self.onUpdate(self.getState())
+                self.callUpdate(self.getState())
                     
     
+    def hasFocus(self):
+        return self.infocus
+
+    def setFocus(self, focused):
+        if focused != self.infocus:
+            self.infocus = focused
+            self.invalidate()
+
     def getState(self):
-        return self.text
+        return self.buffer.getText()
+
+    # replaces the text in the field and moves the cursor to the start
+    # text: str
+    def setText(self, text):
+        self.buffer.setText(text)
+        self.textoffset = [0,0]
+        self.setCursor(0, 0)
+        self.invalidate()
     
     def reset(self):
-        self.text = self.defaulttext
-        self.cursor = 0
-        self.textoffset = [0,0]
+        self.setText(self.defaulttext)
+
+# a scrollable list (or table, if columns is given) that can show any number of rows.
+# rows are not UI objects, instead the list keeps a small pool of row slots covering the visible window and
+# reuses them as it scrolls, asking the data source for a row only when a slot is filled. Rendered rows are
+# kept in an LRU cache, so drawing and scrolling cost depends on the size of the list, not the amount of data.
+# data: a sequence, or a function taking a row index. Each row is a string, or a sequence of strings for a table.
+# rowcount: int or a function returning one. Can be left out if data is a sequence.
+# columns: int[], the width of each column. If None, each row is shown as a single string.
+# onUpdate is called with the selected row index when the selection changes.
+class ListView(UIObject):
+    __slots__ = (
+        "data", "rowcount", "columns", "textcolor", "bgcolor", "altbgcolor", "selectedcolor", "font",
+        "rowheight", "padding", "scroll", "selected", "infocus", "rowpool", "rowcache"
+    )
+    eventtypes = (pygame.MOUSEBUTTONDOWN, pygame.MOUSEWHEEL, pygame.KEYDOWN)
+
+    def __init__(self, rect, data, rowcount=None, columns=None, textcolor=(0,0,0), bgcolor=(255,255,255), altbgcolor=(240,240,240), selectedcolor=(160,190,230), rowheight=None, fontname="sfns", fontsize=12, padding=4, cachebudget=2*1024*1024, onUpdate=None):
+        super().__init__(rect, onUpdate)
+        self.data = data
+        self.rowcount = rowcount
+        self.columns = columns
+        self.textcolor = paletteColor(textcolor)
+        self.bgcolor = paletteColor(bgcolor)
+        self.altbgcolor = paletteColor(altbgcolor)
+        self.selectedcolor = paletteColor(selectedcolor)
+        self.font = getFont(fontname, fontsize)
+        self.rowheight = self.font.get_linesize() + padding if rowheight is None else rowheight
+        self.padding = padding
 
-        self.cursor = 0
-        self.rcp = self.getrelativecursorpos()
+        self.scroll = 0
+        self.selected = None
+        self.infocus = False
+
+        # each slot is [row index, surface], slot i always shows a row with index i modulo the pool size
+        self.rowpool = []
+        self.rowcache = RenderCache(cachebudget)
+
+    # returns the number of rows in the data
+    # -> int
+    def getRowCount(self):
+        if self.rowcount is None:
+            return len(self.data)
+        if callable(self.rowcount):
+            return self.rowcount()
+        return self.rowcount
+
+    # returns the data for a row
+    # -> str or str[]
+    def getRow(self, index):
+        if callable(self.data):
+            return self.data(index)
+        return self.data[index]
+
+    # returns the first visible row and the number of rows that fit in the list
+    # -> (int, int)
+    def getVisibleRows(self):
+        return (int(self.scroll // self.rowheight), self.rect[3] // self.rowheight + 2)
+
+    # returns the rendered surface for a row, using the cache if possible
+    # index: int
+    # -> pygame.Surface
+    def renderRow(self, index):
+        key = (index, index == self.selected)
+        surface = self.rowcache.lookup(key)
+        if surface is not None:
+            return surface
+
+        if index == self.selected:
+            bgcolor = self.selectedcolor
+        elif index % 2:
+            bgcolor = self.altbgcolor
+        else:
+            bgcolor = self.bgcolor
+        surface = newSurface((self.rect[2], self.rowheight))
+        surface.fill(bgcolor)
+
+        row = self.getRow(index)
+        if self.columns is None:
+            cells = [(str(row), self.rect[2])]
+        else:
+            cells = zip([str(cell) for cell in row], self.columns)
+        x = 0
+        for text, width in cells:
+            textsurface = renderLine(self.font, text, True, self.textcolor)
+            surface.blit(
+                textsurface,
+                (x + self.padding, (self.rowheight - textsurface.get_height())//2),
+                (0, 0, max(width - 2*self.padding, 0), self.rowheight)
+            )
+            x += width
+
+        self.rowcache.store(key, surface)
+        return surface
+
+    # rows are rendered as wide as the list, so they are thrown away when its width changes
+    def rectChanged(self):
+        super().rectChanged()
+        if any(slot[1] is not None and slot[1].get_width() != self.rect[2] for slot in self.rowpool):
+            self.refresh()
+
+    def draw(self, surface):
+        first, count = self.getVisibleRows()
+        if len(self.rowpool) != count:
+            self.rowpool = [[None, None] for _ in range(count)]
+        rowcount = self.getRowCount()
+
+        oldclip = surface.get_clip()
+        surface.set_clip(self.rect.clip(oldclip))
+        surface.fill(self.bgcolor, self.rect)
+
+        y = self.rect[1] - int(self.scroll % self.rowheight)
+        for index in range(first, min(first + count, rowcount)):
+            slot = self.rowpool[index % count]
+            # recycle the slot if it was showing a row that scrolled away
+            if slot[0] != index or slot[1] is None:
+                slot[0] = index
+                slot[1] = self.renderRow(index)
+            surface.blit(slot[1], (self.rect[0], y))
+            y += self.rowheight
+
+        # scrollbar
+        totalheight = rowcount * self.rowheight
+        if totalheight > self.rect[3]:
+            barheight = max(self.rect[3] * self.rect[3] // totalheight, 8)
+            bary = self.rect[1] + int((self.rect[3] - barheight) * self.scroll / (totalheight - self.rect[3]))
+            pygame.draw.rect(surface, self.altbgcolor, (self.rect.right - 6, self.rect[1], 6, self.rect[3]))
+            pygame.draw.rect(surface, self.textcolor, (self.rect.right - 5, bary, 4, barheight), border_radius=2)
+
+        surface.set_clip(oldclip)
+
+    # scrolls by a number of pixels, staying within the data
+    # dy: int
+    def scrollBy(self, dy):
+        maxscroll = max(self.getRowCount() * self.rowheight - self.rect[3], 0)
+        newscroll = min(max(self.scroll + dy, 0), maxscroll)
+        if newscroll != self.scroll:
+            self.scroll = newscroll
+            self.invalidate()
+
+    # scrolls the least amount needed for a row to be fully visible
+    # index: int
+    def scrollTo(self, index):
+        top = index * self.rowheight
+        if top < self.scroll:
+            self.scrollBy(top - self.scroll)
+        elif top + self.rowheight > self.scroll + self.rect[3]:
+            self.scrollBy(top + self.rowheight - self.rect[3] - self.scroll)
+
+    # selects a row (or nothing, with None) and calls onUpdate
+    # index: int or None
+    def select(self, index):
+        if index == self.selected:
+            return
+        # the old and new selected rows look different now
+        for slot in self.rowpool:
+            if slot[0] == self.selected or slot[0] == index:
+                slot[1] = None
+        self.selected = index
+        if index is not None:
+            self.scrollTo(index)
+        self.invalidate()
+        self.callUpdate(self.getState())
+
+    # forgets cached rows after the data has changed. If index is None, every row is forgotten.
+    # index: int or None
+    def refresh(self, index = None):
+        if index is None:
+            self.rowcache.clear()
+            self.rowpool = []
+        else:
+            self.rowcache.remove((index, False))
+            self.rowcache.remove((index, True))
+            for slot in self.rowpool:
+                if slot[0] == index:
+                    slot[1] = None
+        self.scrollBy(0)
+        self.invalidate()
+
+    def handleEvent(self, event):
+        if event.type == pygame.MOUSEWHEEL:
+            # wheel events don't have a position, but Panel adds one so it can be made relative
+            if self.rect.collidepoint(getattr(event, "pos", None) or pygame.mouse.get_pos()):
+                self.scrollBy(-event.y * self.rowheight * 3)
+
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            self.infocus = self.rect.collidepoint(event.pos)
+            if self.infocus and event.button == 1:
+                index = int((event.pos[1] - self.rect[1] + self.scroll) // self.rowheight)
+                if index < self.getRowCount():
+                    self.select(index)
+
+        elif event.type == pygame.KEYDOWN and self.infocus:
+            rowcount = self.getRowCount()
+            if rowcount == 0:
+                return
+            pagesize = max(self.rect[3] // self.rowheight - 1, 1)
+            current = -1 if self.selected is None else self.selected
+            if event.key == pygame.K_DOWN:
+                self.select(min(current + 1, rowcount - 1))
+            elif event.key == pygame.K_UP:
+                self.select(max(current - 1, 0))
+            elif event.key == pygame.K_PAGEDOWN:
+                self.select(min(current + pagesize, rowcount - 1))
+            elif event.key == pygame.K_PAGEUP:
+                self.select(max(current - pagesize, 0))
+            elif event.key == pygame.K_HOME:
+                self.select(0)
+            elif event.key == pygame.K_END:
+                self.select(rowcount - 1)
+            elif event.key == pygame.K_ESCAPE:
+                self.infocus = False
+
+    def hasFocus(self):
+        return self.infocus
+
+    def setFocus(self, focused):
+        self.infocus = focused
+
+    # returns the index of the selected row, or None
+    # -> int or None
+    def getState(self):
+        return self.selected
+
+    def reset(self):
+        self.scroll = 0
+        self.select(None)
+
+# a container for other UI objects. Its children are kept in their own UIObjectGroup and their rects are relative
+# to the panel's top left corner. The children are drawn into a cached surface that is only redrawn when one of
+# them is invalidated, so moving the panel (or redrawing around it) just blits the cached surface, and the group
+# the panel is in only has to hit test the panel itself.
+# bgcolor: int[3] or pygame.color, or None for a transparent panel
+class Panel(UIObject):
+    __slots__ = ("children", "bgcolor", "surface", "stale")
+
+    def __init__(self, rect, bgcolor=None, children=None, onUpdate=None):
+        super().__init__(rect, onUpdate)
+        self.bgcolor = None if bgcolor is None else paletteColor(bgcolor)
+        self.children = UIObjectGroup()
+        self.children.owner = self
+        self.surface = None
+        self.stale = True
+        for child in children or []:
+            self.addObject(child)
+
+    # moves an object into the panel, taking it out of any other groups (e.g. all_objects).
+    # its rect is from then on relative to the panel.
+    # object: UIObject
+    def addObject(self, object):
+        for g in list(object.groups):
+            g.removeObject(object)
+        self.children.addObject(object)
+
+    # removes an object from the panel
+    # object: UIObject
+    def removeObject(self, object):
+        self.children.removeObject(object)
+
+    # returns the group holding the panel's children
+    # -> UIObjectGroup
+    def getChildren(self):
+        return self.children
+
+    def invalidate(self):
+        self.stale = True
+        super().invalidate()
+
+    # moving the panel only changes where its surface is copied to, so the children aren't redrawn.
+    # draw makes a new surface if the size changed.
+    def rectChanged(self):
+        for g in self.groups:
+            g.updateObject(self)
+        UIObject.invalidate(self)
+
+    def draw(self, surface):
+        size = (self.rect[2], self.rect[3])
+        if self.surface is None or self.surface.get_size() != size:
+            self.surface = newSurface(size, pygame.SRCALPHA)
+            self.stale = True
+        if self.stale:
+            self.surface.fill((0,0,0,0) if self.bgcolor is None else self.bgcolor)
+            self.children.draw(self.surface)
+            self.stale = False
+        surface.blit(self.surface, self.rect)
+
+    # returns a copy of an event with its position made relative to the panel
+    # -> pygame.event.Event
+    def localEvent(self, event):
+        if event.type in MOUSEEVENTS:
+            pos = event.pos
+        elif event.type == pygame.MOUSEWHEEL:
+            # wheel events have no position, unless an outer Panel already gave them one
+            pos = getattr(event, "pos", None) or pygame.mouse.get_pos()
+        else:
+            return event
+        attributes = dict(event.dict)
+        attributes["pos"] = (pos[0] - self.rect[0], pos[1] - self.rect[1])
+        return pygame.event.Event(event.type, attributes)
+
+    def handleEvent(self, event):
+        self.children.handleEvent(self.localEvent(event))
+
+    def hasCapture(self):
+        return self.children.getCapture() is not None
+
+    def hasFocus(self):
+        return self.children.getFocus() is not None
+
+    def setFocus(self, focused):
+        if not focused:
+            self.children.setFocus(None)
+
+    def reset(self):
+        self.children.reset()
+
+# a stack of UIObjectGroups drawn on top of each other, for things like popups, dropdowns and tooltips.
+# Each layer is a retained group with a transparent backbuffer, which acts as the layer's cached surface. When a
+# layer changes only that layer redraws its objects; the changed areas of the screen are then put back together
+# from the cached surfaces of all the layers, so the layers below an overlay are never redrawn because of it.
+# Events go to the layers from the top down. A modal layer takes every event, otherwise a pointer event goes to
+# the top layer with an object under the pointer (or with capture), and keyboard events go to the top layer with focus.
+# It has the parts of UIObjectGroup's interface that a main loop uses, so it can be passed to AsyncRunner.
+class LayerStack:
+    # bgcolor: int[3] or pygame.color, what is under the bottom layer
+    def __init__(self, bgcolor = (255,255,255)):
+        self.bgcolor = pygame.Color(bgcolor)
+        self.layers = []        # [name, group, z, visible, modal], sorted by z
+        self.dirtyrects = []    # areas of layers that were shown or hidden
+        self.size = None
+
+    # adds an empty layer and returns its group. Layers with a higher z are drawn on top
+    # name: str
+    # z: int
+    # modal: bool
+    # -> UIObjectGroup
+    def addLayer(self, name, z = 0, modal = False):
+        group = UIObjectGroup()
+        group.setRetained(True, None)
+        self.layers.append([name, group, z, True, modal])
+        # sort is stable, so layers with the same z stay in the order they were added
+        self.layers.sort(key=lambda layer: layer[2])
+        return group
+
+    # returns the layer's entry
+    # -> list
+    def findLayer(self, name):
+        for layer in self.layers:
+            if layer[0] == name:
+                return layer
+        raise KeyError("no layer named " + str(name))
+
+    # removes a layer
+    # name: str
+    def removeLayer(self, name):
+        layer = self.findLayer(name)
+        if layer[3]:
+            self.dirtyrects.extend(self.getLayerRects(layer))
+        self.layers.remove(layer)
+
+    # -> UIObjectGroup
+    def getLayer(self, name):
+        return self.findLayer(name)[1]
+
+    # moves an object into a layer, taking it out of any other groups (e.g. all_objects)
+    # name: str
+    # object: UIObject
+    def addObject(self, name, object):
+        for g in list(object.groups):
+            g.removeObject(object)
+        self.getLayer(name).addObject(object)
+
+    # shows or hides a layer. Hidden layers aren't drawn and get no events
+    # name: str
+    # visible: bool
+    def setVisible(self, name, visible):
+        layer = self.findLayer(name)
+        if layer[3] != visible:
+            layer[3] = visible
+            self.dirtyrects.extend(self.getLayerRects(layer))
+            if not visible:
+                layer[1].setFocus(None)
+
+    # a modal layer gets every event while it is visible
+    # name: str
+    # modal: bool
+    def setModal(self, name, modal):
+        self.findLayer(name)[4] = modal
+
+    # returns the areas that a layer's objects cover
+    # -> pygame.Rect[]
+    def getLayerRects(self, layer):
+        group = layer[1]
+        if group.backbuffer is not None:
+            return list(group.drawnrects.values())
+        return [o.getDrawRect() for o in group.objects]
+
+    # draws the changed parts of the screen and returns them, like UIObjectGroup.draw
+    # surface: pygame.Surface
+    # -> pygame.Rect[]
+    def draw(self, surface):
+        if textrasterizer.finished:
+            textrasterizer.collect()
+        size = surface.get_size()
+        regions = self.dirtyrects
+        self.dirtyrects = []
+        if size != self.size:
+            self.size = size
+            regions = [surface.get_rect()]
+        for layer in self.layers:
+            # hidden layers keep up to date too, so showing them is only a blit
+            changed = layer[1].updateBackbuffer(size)
+            if layer[3]:
+                regions.extend(changed)
+
+        bounds = surface.get_rect()
+        regions = [r.clip(bounds) for r in mergeRects(regions)]
+        regions = [r for r in regions if r.width > 0 and r.height > 0]
+        visible = [layer[1].backbuffer for layer in self.layers if layer[3]]
+        for region in regions:
+            surface.fill(self.bgcolor, region)
+            surface.blits([(backbuffer, region, region) for backbuffer in visible], doreturn=False)
+        return regions
+
+    def handleEvent(self, event):
+        if event.type in MOUSEEVENTS:
+            # a drag stays with the layer it started on, whatever is under the pointer
+            for layer in reversed(self.layers):
+                if layer[3] and layer[1].getCapture() is not None:
+                    layer[1].handleEvent(event)
+                    self.leaveLayersBelow(layer, event)
+                    return
+        for layer in reversed(self.layers):
+            name, group, z, visible, modal = layer
+            if not visible:
+                continue
+            if modal:
+                group.handleEvent(event)
+                if event.type in MOUSEEVENTS:
+                    self.leaveLayersBelow(layer, event)
+                return
+            if event.type in MOUSEEVENTS:
+                if group.getCapture() is not None or group.getObjectsAt(event.pos):
+                    group.handleEvent(event)
+                    self.leaveLayersBelow(layer, event)
+                    return
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    # clicking outside a layer takes focus away from it
+                    group.setFocus(None)
+            elif event.type in KEYBOARDEVENTS:
+                if group.getFocus() is not None:
+                    group.handleEvent(event)
+                    return
+            else:
+                group.handleEvent(event)
+        if event.type in KEYBOARDEVENTS:
+            # nothing has focus, objects that listen to every event still get it
+            for layer in self.layers:
+                if layer[3]:
+                    layer[1].handleEvent(event)
+
+    # see UIObjectGroup.handleEvents
+    def handleEvents(self, events):
+        events, coalesced = coalesceEvents(events)
+        for event in events:
+            self.handleEvent(event)
+        return coalesced
+
+    # when the pointer moves onto an upper layer, objects below it are told that it has left them, and pressing
+    # on an upper layer takes focus away from the layers below, like clicking outside an object in one group
+    # layer: list, the layer that got the event
+    # event: pygame.event.Event
+    def leaveLayersBelow(self, layer, event):
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            for below in self.layers[:self.layers.index(layer)]:
+                if below[3]:
+                    below[1].setFocus(None)
+            return
+        if event.type != pygame.MOUSEMOTION:
+            return
+        outside = None
+        for below in self.layers[:self.layers.index(layer)]:
+            if below[1].hovered:
+                if outside is None:
+                    attributes = dict(event.dict)
+                    attributes["pos"] = (-1, -1)
+                    outside = pygame.event.Event(event.type, attributes)
+                below[1].handleEvent(outside)
+
+    def flushUpdates(self):
+        return sum(layer[1].flushUpdates() for layer in self.layers)
+
+    # the stack fills its own background, so the target never needs clearing
+    def isRetained(self):
+        return True
+
+    def getBackend(self):
+        return softwarebackend
+
+# easing functions for Tweener, all quadratic
+EASINGS = ("linear", "in", "out", "inout")
+
+# animates the positions and colors of many objects. All tweens are kept in one table (NumPy arrays if NumPy is
+# installed) and advanced together by update(), which should be called once per frame. Objects are only touched
+# when the integer value of their tween changes, so they are only invalidated when they actually look different.
+class Tweener:
+    def __init__(self):
+        self.targets = []       # (object, attribute) of each tween, attribute is None for the position
+        self.callbacks = []     # onDone of each tween
+        self.alive = []         # False once cancelled
+        self.rows = {}          # (object, attribute) -> row
+        self.added = []         # tweens that join the table on the next update
+        # every tween has 4 channels, x and y for positions (the rest are 0) and r, g, b and a for colors
+        self.start = []
+        self.delta = []
+        self.starttime = []
+        self.duration = []
+        self.easing = []
+        self.current = []       # the integer value that was last written
+
+    # starts a tween, replacing any other tween of the same object and attribute
+    def animate(self, object, attribute, start, end, duration, easing = "linear", onDone = None):
+        if easing not in EASINGS:
+            raise ValueError("unknown easing: " + str(easing))
+        self.cancel(object, attribute)
+        self.added.append((
+            (object, attribute),
+            tuple(start),
+            tuple(e - s for s, e in zip(start, end)),
+            time.perf_counter(),
+            max(duration, 1e-9),
+            EASINGS.index(easing),
+            onDone
+        ))
+
+    # moves an object's top left corner to pos over duration seconds
+    # object: UIObject
+    # pos: float[2]
+    # duration: float
+    # easing: str, one of EASINGS
+    # onDone: function, called with no arguments when the object arrives
+    def moveTo(self, object, pos, duration, easing = "linear", onDone = None):
+        start = (object.rect.x + object.subpixel[0], object.rect.y + object.subpixel[1], 0, 0)
+        self.animate(object, None, start, (pos[0], pos[1], 0, 0), duration, easing, onDone)
+
+    # changes a color attribute of an object, e.g. a Textbox's textcolor, over duration seconds
+    # attribute: str
+    # color: int[3] or pygame.color
+    def colorTo(self, object, attribute, color, duration, easing = "linear", onDone = None):
+        self.animate(object, attribute, tuple(pygame.Color(getattr(object, attribute))), tuple(pygame.Color(color)), duration, easing, onDone)
+
+    # stops a tween where it is. attribute is None for the position
+    def cancel(self, object, attribute = None):
+        key = (object, attribute)
+        self.added = [tween for tween in self.added if tween[0] != key]
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self.alive[row] = False
+
+    # -> bool
+    def isAnimating(self, object, attribute = None):
+        key = (object, attribute)
+        return key in self.rows or any(tween[0] == key for tween in self.added)
+
+    # -> int, the number of running tweens
+    def getCount(self):
+        return len(self.rows) + len(self.added)
+
+    # moves the tweens started since the last update into the table
+    def join(self):
+        added = self.added
+        self.added = []
+        for key, start, delta, starttime, duration, easing, onDone in added:
+            self.rows[key] = len(self.targets)
+            self.targets.append(key)
+            self.callbacks.append(onDone)
+            self.alive.append(True)
+            if numpy is None:
+                self.start.append(start)
+                self.delta.append(delta)
+                self.starttime.append(starttime)
+                self.duration.append(duration)
+                self.easing.append(easing)
+                self.current.append(tuple(math.floor(v) for v in start))
+
+        if numpy is not None and added:
+            self.start = numpy.concatenate([numpy.reshape(self.start, (-1, 4)), [a[1] for a in added]])
+            self.delta = numpy.concatenate([numpy.reshape(self.delta, (-1, 4)), [a[2] for a in added]])
+            self.starttime = numpy.concatenate([self.starttime, [a[3] for a in added]])
+            self.duration = numpy.concatenate([self.duration, [a[4] for a in added]])
+            self.easing = numpy.concatenate([self.easing, numpy.array([a[5] for a in added], dtype=numpy.int8)])
+            self.current = numpy.concatenate([
+                numpy.reshape(self.current, (-1, 4)).astype(numpy.int64),
+                numpy.floor([a[1] for a in added]).astype(numpy.int64)
+            ])
+
+    # advances every tween to the current time and writes the values that changed back to their objects
+    # now: float, time.perf_counter() by default
+    # -> int, the number of objects that were changed
+    def update(self, now = None):
+        if now is None:
+            now = time.perf_counter()
+        self.join()
+        if not self.targets:
+            return 0
+
+        if numpy is not None:
+            t = numpy.clip((now - self.starttime) / self.duration, 0, 1)
+            easing = self.easing
+            eased = numpy.select(
+                [easing == 1, easing == 2, easing == 3],
+                [t*t, 1 - (1-t)**2, numpy.where(t < 0.5, 2*t*t, 1 - (2 - 2*t)**2 / 2)],
+                t
+            )
+            values = self.start + self.delta * eased[:, None]
+            ints = numpy.floor(values).astype(numpy.int64)
+            changed = numpy.flatnonzero((ints != self.current).any(axis=1) & numpy.array(self.alive)).tolist()
+            self.current = ints
+            finished = (t >= 1).tolist()
+            for row in changed:
+                self.write(row, values[row].tolist())
+            count = len(changed)
+        else:
+            count = 0
+            finished = []
+            for row in range(len(self.targets)):
+                t = min(max((now - self.starttime[row]) / self.duration[row], 0), 1)
+                easing = self.easing[row]
+                if easing == 1:
+                    t2 = t*t
+                elif easing == 2:
+                    t2 = 1 - (1-t)**2
+                elif easing == 3:
+                    t2 = 2*t*t if t < 0.5 else 1 - (2 - 2*t)**2 / 2
+                else:
+                    t2 = t
+                values = [s + d*t2 for s, d in zip(self.start[row], self.delta[row])]
+                ints = tuple(math.floor(v) for v in values)
+                if ints != self.current[row] and self.alive[row]:
+                    self.current[row] = ints
+                    self.write(row, values)
+                    count += 1
+                finished.append(t >= 1)
+
+        done = [self.callbacks[row] for row in range(len(self.targets)) if finished[row] and self.alive[row]]
+        if any(finished) or not all(self.alive):
+            self.compact([alive and not over for alive, over in zip(self.alive, finished)])
+        for onDone in done:
+            if onDone is not None:
+                onDone()
+        return count
+
+    # writes a tween's value to its object
+    # row: int
+    # values: float[4]
+    def write(self, row, values):
+        object, attribute = self.targets[row]
+        if attribute is None:
+            object.setRect([values[0], values[1], None, None])
+        else:
+            setattr(object, attribute, pygame.Color(*[min(max(int(v), 0), 255) for v in values]))
+            object.invalidate()
+
+    # keeps only the rows where keep is True
+    # keep: bool[]
+    def compact(self, keep):
+        rows = [row for row in range(len(keep)) if keep[row]]
+        self.targets = [self.targets[row] for row in rows]
+        self.callbacks = [self.callbacks[row] for row in rows]
+        self.alive = [True] * len(rows)
+        self.rows = {key: row for row, key in enumerate(self.targets)}
+        if numpy is not None:
+            for name in ("start", "delta", "starttime", "duration", "easing", "current"):
+                setattr(self, name, getattr(self, name)[rows])
+        else:
+            for name in ("start", "delta", "starttime", "duration", "easing", "current"):
+                values = getattr(self, name)
+                setattr(self, name, [values[row] for row in rows])
+
+# drives a group from an asyncio event loop instead of a blocking while loop, so that coroutine onUpdate handlers
+# and other tasks keep running between frames. Every frame it handles pygame's events, flushes held back onUpdate
+# calls, calls onFrame(seconds since the last frame), then draws and presents the group. If the group isn't
+# retained the surface is filled with bgcolor before drawing, as a hand-written loop would.
+#   asyncio.run(PygameUI.AsyncRunner().run())
+class AsyncRunner:
+    # group: UIObjectGroup, defaults to all_objects
+    # surface: pygame.Surface, defaults to the display surface
+    # fps: int
+    # onFrame: function
+    # bgcolor: int[3] or pygame.color
+    def __init__(self, group = None, surface = None, fps = 40, onFrame = None, bgcolor = (255,255,255)):
+        self.group = group
+        self.surface = surface
+        self.fps = fps
+        self.onFrame = onFrame
+        self.bgcolor = pygame.Color(bgcolor)
+        self.running = False
+        self.coalesced = 0      # the number of motion events merged by handleEvents so far
+
+    # runs until stop() is called or the window is closed
+    async def run(self):
+        group = all_objects if self.group is None else self.group
+        surface = pygame.display.get_surface() if self.surface is None else self.surface
+        loop = asyncio.get_running_loop()
+        frametime = 1 / self.fps
+        lastframe = loop.time()
+        nextframe = lastframe
+
+        self.running = True
+        while self.running:
+            events = pygame.event.get()
+            if any(event.type == pygame.QUIT for event in events):
+                self.running = False
+            self.coalesced += group.handleEvents(events)
+            group.flushUpdates()
+
+            now = loop.time()
+            if self.onFrame is not None:
+                self.onFrame(now - lastframe)
+            lastframe = now
+
+            if not group.isRetained():
+                surface.fill(self.bgcolor)
+            group.getBackend().present(group.draw(surface))
+
+            # sleeping even when behind lets the other tasks run
+            nextframe = max(nextframe + frametime, loop.time())
+            await asyncio.sleep(nextframe - loop.time())
+
+    # makes run return after the current frame
+    def stop(self):
+        self.running = False
+
+# the widget types scene files can use, by name. Add your own with registerWidgetType
+widgettypes = {}
+
+# makes a UIObject subclass usable in scene files
+# name: str
+# widgettype: class
+def registerWidgetType(name, widgettype):
+    widgettypes[name] = widgettype
+
+# compiled scenes are cached here, see Scene.load
+scenecachedir = os.path.join(os.path.dirname(fontindexpath), "scenes")
+SCENEFORMAT = 1
+
+# a screen of UI objects described in a JSON or TOML file, e.g.
+#   {"retained": true, "bgcolor": [255,255,255], "widgets": [
+#       {"type": "Textfield", "id": "name", "rect": [10,10,200,30]},
+#       {"type": "Button", "rect": [10,50,90,30], "text": "Clear", "onUpdate": "name.reset"},
+#       {"type": "Button", "rect": [110,50,90,30], "text": "Save", "onUpdate": "save"}
+#   ]}
+# every key of a widget other than type, id, children and onUpdate is passed to its constructor. onUpdate names a
+# function passed to build, or a method of a widget with an id. Panels take their children as a list of widgets.
+class Scene:
+    # spec: dict, a parsed scene file
+    def __init__(self, spec):
+        self.spec = spec
+        self.widgets = Scene.compileWidgets(spec.get("widgets", []))
+
+    # checks the widgets of a scene and turns them into (type, id, arguments, onUpdate, children) tuples
+    # -> tuple[]
+    @staticmethod
+    def compileWidgets(widgets):
+        compiled = []
+        for widget in widgets:
+            arguments = dict(widget)
+            typename = arguments.pop("type", "UIObject")
+            if typename not in widgettypes:
+                raise ValueError("unknown widget type in scene: " + str(typename))
+            id = arguments.pop("id", None)
+            onupdate = arguments.pop("onUpdate", None)
+            children = tuple(Scene.compileWidgets(arguments.pop("children", [])))
+            compiled.append((typename, id, arguments, onupdate, children))
+        return compiled
+
+    # makes a scene from its compiled widgets, skipping the checks
+    # spec: dict, the scene without its widgets
+    # widgets: tuple[], from compileWidgets
+    # -> Scene
+    @staticmethod
+    def fromCompiled(spec, widgets):
+        scene = Scene.__new__(Scene)
+        scene.spec, scene.widgets = spec, widgets
+        return scene
+
+    # returns the names of the functions the scene's onUpdates need from build's callbacks
+    # -> str[]
+    def getCallbackNames(self):
+        names = []
+        def find(widgets):
+            for typename, id, arguments, onupdate, children in widgets:
+                if onupdate is not None and "." not in onupdate:
+                    names.append(onupdate)
+                find(children)
+        find(self.widgets)
+        return names
+
+    # reads a scene file, using the compiled copy in scenecachedir if the file hasn't changed since it was made
+    # path: str, a .json or .toml file
+    # -> Scene
+    @staticmethod
+    def load(path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        cachepath = os.path.join(scenecachedir, hashlib.sha1(path.encode()).hexdigest() + ".scene")
+        header = (SCENEFORMAT, stat.st_mtime_ns, stat.st_size)
+        try:
+            with open(cachepath, "rb") as f:
+                cached = marshal.load(f)
+            if cached[0] == header:
+                return Scene.fromCompiled(cached[1], cached[2])
+        except (OSError, ValueError, EOFError, TypeError, IndexError):
+            pass
+
+        if path.endswith(".toml"):
+            if tomllib is None:
+                raise ValueError("TOML scenes need Python 3.11 or newer")
+            with open(path, "rb") as f:
+                spec = tomllib.load(f)
+        else:
+            with open(path) as f:
+                spec = json.load(f)
+        scene = Scene(spec)
+
+        try:
+            os.makedirs(scenecachedir, exist_ok=True)
+            with open(cachepath, "wb") as f:
+                marshal.dump((header, {k: v for k, v in spec.items() if k != "widgets"}, scene.widgets), f)
+        except (OSError, ValueError):
+            # the cache is only a speedup
+            pass
+        return scene
+
+    # creates the scene's UI objects in a new group, which is returned along with the objects that have an id
+    # callbacks: dict, function name -> function, for onUpdate
+    # -> (UIObjectGroup, dict)
+    def build(self, callbacks = None):
+        global targetgroup
+        group = UIObjectGroup()
+        ids = {}
+        updates = []
+
+        def create(widgets):
+            created = []
+            for typename, id, arguments, onupdate, children in widgets:
+                if children:
+                    arguments = dict(arguments, children=create(children))
+                o = widgettypes[typename](**arguments)
+                if id is not None:
+                    ids[id] = o
+                if onupdate is not None:
+                    updates.append((o, onupdate))
+                created.append(o)
+            return created
+
+        previous = targetgroup
+        targetgroup = group
+        try:
+            create(self.widgets)
+        finally:
+            targetgroup = previous
+
+        # after everything is created, so callbacks can refer to widgets that come later
+        for o, name in updates:
+            if callbacks is not None and name in callbacks:
+                o.onUpdate = callbacks[name]
+            elif "." in name and name.split(".", 1)[0] in ids:
+                widgetid, method = name.split(".", 1)
+                o.onUpdate = getattr(ids[widgetid], method)
+            else:
+                raise ValueError("unknown onUpdate in scene: " + name)
+
+        if self.spec.get("retained", False):
+            group.setRetained(True, self.spec.get("bgcolor", (255,255,255)))
+        return group, ids
+
+TRACEMAGIC = b"PUITRACE"
+TRACEFORMAT = 1
+
+# records the events a group handles and when it draws, so a session can be replayed later (see Replay.py).
+# The trace also holds the scene the group was built from, so the replay can rebuild the same widgets.
+#   recorder = PygameUI.TraceRecorder(group, scene)
+#   recorder.start()
+#   ... run the UI ...
+#   recorder.stop()
+#   recorder.save("session.trace")
+class TraceRecorder:
+    # group: UIObjectGroup, or anything that stands in for one, like a SceneManager or LayerStack
+    # scene: Scene the group was built from, or None
+    # size: int[2], the size of the screen, defaults to the display surface's
+    def __init__(self, group, scene = None, size = None):
+        self.group = group
+        self.scene = scene
+        self.size = size
+        self.events = []    # (frame, seconds since start, type, attributes)
+        self.frame = 0
+        self.starttime = None
+        self.originalhandleevent = None     # the group's own handleEvent and draw while recording
+        self.originaldraw = None
+
+    # starts recording by wrapping the group's handleEvent and draw
+    def start(self):
+        if self.size is None and pygame.display.get_surface() is not None:
+            self.size = pygame.display.get_surface().get_size()
+        self.starttime = time.perf_counter()
+        self.originalhandleevent = self.group.handleEvent
+        self.originaldraw = self.group.draw
+        self.group.handleEvent = self.recordEvent
+        self.group.draw = self.recordDraw
+
+    # stops recording
+    def stop(self):
+        del self.group.handleEvent
+        del self.group.draw
+        self.originalhandleevent = None
+        self.originaldraw = None
+
+    def recordEvent(self, event):
+        attributes = {}
+        if event.type == pygame.MOUSEWHEEL:
+            # wheel events go to whatever is under the pointer, which isn't known when replaying
+            attributes["pos"] = pygame.mouse.get_pos()
+        for key, value in event.dict.items():
+            # keeps what can be saved, e.g. not the window
+            try:
+                marshal.dumps(value)
+            except ValueError:
+                continue
+            attributes[key] = value
+        self.events.append((self.frame, time.perf_counter() - self.starttime, event.type, attributes))
+        self.originalhandleevent(event)
+
+    def recordDraw(self, surface):
+        rects = self.originaldraw(surface)
+        self.frame += 1
+        return rects
+
+    # writes the trace: a magic number and version, then the header and events, marshalled and compressed
+    # path: str
+    def save(self, path):
+        scene = None
+        if self.scene is not None:
+            scene = ({k: v for k, v in self.scene.spec.items() if k != "widgets"}, self.scene.widgets)
+        header = {"size": None if self.size is None else tuple(self.size), "frames": self.frame, "scene": scene}
+        with open(path, "wb") as f:
+            f.write(TRACEMAGIC + bytes([TRACEFORMAT]))
+            f.write(zlib.compress(marshal.dumps((header, self.events)), 9))
+
+# reads a trace written by TraceRecorder
+# path: str
+# -> (dict, list), the header and the events as (frame, seconds since start, type, attributes)
+def loadTrace(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(TRACEMAGIC)] != TRACEMAGIC:
+        raise ValueError(path + " is not a PygameUI trace")
+    if data[len(TRACEMAGIC)] != TRACEFORMAT:
+        raise ValueError(path + " was written by a different version of PygameUI")
+    header, events = marshal.loads(zlib.decompress(data[len(TRACEMAGIC)+1:]))
+    if header["scene"] is not None:
+        header["scene"] = Scene.fromCompiled(*header["scene"])
+    return header, events
+
+# keeps several scenes built at once and switches between them without rebuilding. It has the parts of
+# UIObjectGroup's interface that a main loop uses, so it can be passed to AsyncRunner in place of a group.
+class SceneManager:
+    def __init__(self):
+        self.groups = {}
+        self.ids = {}
+        self.active = None
+
+    # adds a scene, either a Scene, which is built, or an already built group
+    # name: str
+    # scene: Scene or UIObjectGroup
+    # callbacks: dict, see Scene.build
+    def addScene(self, name, scene, callbacks = None):
+        if isinstance(scene, Scene):
+            group, ids = scene.build(callbacks)
+        else:
+            group, ids = scene, {}
+        self.groups[name] = group
+        self.ids[name] = ids
+        if self.active is None:
+            self.active = name
+
+    # forgets a scene
+    # name: str
+    def removeScene(self, name):
+        del self.groups[name]
+        del self.ids[name]
+        if self.active == name:
+            self.active = None
+
+    # makes a scene the one that is drawn and gets events. Nothing is rebuilt: a retained scene just copies
+    # its backbuffer to the screen on the next draw.
+    # name: str
+    def show(self, name):
+        if name == self.active:
+            return
+        group = self.groups[name]
+        if self.active is not None:
+            # the pointer has left the old scene's objects
+            self.groups[self.active].setFocus(None)
+        group.expose()
+        self.active = name
+
+    # -> str
+    def getActiveName(self):
+        return self.active
+
+    # -> UIObjectGroup
+    def getActive(self):
+        return self.groups[self.active]
+
+    # returns a widget of a scene by its id
+    # -> UIObject
+    def getWidget(self, name, id):
+        return self.ids[name][id]
+
+    def handleEvent(self, event):
+        self.getActive().handleEvent(event)
+
+    # see UIObjectGroup.handleEvents
+    def handleEvents(self, events):
+        events, coalesced = coalesceEvents(events)
+        for event in events:
+            self.handleEvent(event)
+        return coalesced
+
+    def flushUpdates(self):
+        return self.getActive().flushUpdates()
+
+    def draw(self, surface):
+        return self.getActive().draw(surface)
+
+    def isRetained(self):
+        return self.getActive().isRetained()
+
+    def getBackend(self):
+        return self.getActive().getBackend()
 
 #############
 ## Globals ##
 #############
 
-all_objects = UIObjectGroup()
\ No newline at end of file
+# events that carry a pointer position, routed by UIObjectGroup's spatial index
+MOUSEEVENTS = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+# events that only go to objects with focus
+KEYBOARDEVENTS = (pygame.KEYDOWN, pygame.KEYUP, pygame.TEXTINPUT, pygame.TEXTEDITING)
+
+for widgettype in [UIObject, Textbox, Button, Slider, Toggle, Textfield, ListView, Panel]:
+    registerWidgetType(widgettype.__name__, widgettype)
+
+all_objects = UIObjectGroup()
+# when set, new UI objects are added to this group instead of all_objects. Used by Scene.build
+targetgroup = None
\ No newline at end of file
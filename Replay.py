@@ -0,0 +1,133 @@
+# replays a trace recorded with PygameUI.TraceRecorder under the dummy video driver
+# rebuilds the trace's scene, feeds the recorded events back frame by frame and reports how long handling events
+# and drawing took for each frame, along with a hash of the framebuffer after every frame.
+#
+# usage:
+#   python Replay.py session.trace                        print per frame timings and hashes
+#   python Replay.py session.trace --save results.json    also store the results
+#   python Replay.py session.trace --compare results.json compare timings and output with stored results,
+#                                                         exits with 1 if any frame looks different
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import argparse
+import hashlib
+import json
+import time
+
+import pygame
+import PygameUI
+
+DEFAULTSIZE = (1280, 720)
+
+
+# replays the trace and returns the result of every frame
+# -> dict[]
+def replay(header, events, scene):
+    size = header["size"] or DEFAULTSIZE
+    # recorded callbacks aren't available here, so they do nothing
+    callbacks = {name: (lambda *args: None) for name in scene.getCallbackNames()}
+    group, ids = scene.build(callbacks)
+    bgcolor = scene.spec.get("bgcolor", (255, 255, 255))
+
+    surface = pygame.Surface(size)
+    surface.fill(bgcolor)
+
+    def drawFrame():
+        if not group.retained:
+            surface.fill(bgcolor)
+        group.draw(surface)
+
+    frames = []
+    index = 0
+    for frame in range(header["frames"]):
+        start = time.perf_counter()
+        while index < len(events) and events[index][0] == frame:
+            _, _, eventtype, attributes = events[index]
+            group.handleEvent(pygame.event.Event(eventtype, attributes))
+            index += 1
+        eventtime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        drawFrame()
+        # threaded text has to be finished and drawn, otherwise the hash depends on how fast the workers were
+        while PygameUI.textrasterizer.wait():
+            drawFrame()
+        drawtime = time.perf_counter() - start
+
+        frames.append({
+            "event_ms": eventtime * 1000,
+            "draw_ms": drawtime * 1000,
+            "hash": hashlib.sha1(pygame.image.tobytes(surface, "RGB")).hexdigest(),
+        })
+    return frames
+
+
+# compares frames with stored results and returns the numbers of the frames that look different
+# -> int[]
+def compare(frames, baseline):
+    different = [i for i, (new, old) in enumerate(zip(frames, baseline)) if new["hash"] != old["hash"]]
+    if len(frames) != len(baseline):
+        print("the stored results have %d frames, the replay has %d" % (len(baseline), len(frames)))
+    for name in ["event_ms", "draw_ms"]:
+        old = sum(f[name] for f in baseline)
+        new = sum(f[name] for f in frames)
+        print("%-10s %10.2f ms -> %10.2f ms (%+.1f%%)" % (name, old, new, (new - old) / old * 100 if old else 0))
+    return different
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a PygameUI trace headlessly")
+    parser.add_argument("trace")
+    parser.add_argument("--scene", help="scene file to use instead of the one in the trace")
+    parser.add_argument("--font", default=PygameUI.defaultfont)
+    parser.add_argument("--save", help="store the results as JSON")
+    parser.add_argument("--compare", help="compare the results with stored JSON results")
+    parser.add_argument("--quiet", action="store_true", help="don't print every frame")
+    args = parser.parse_args()
+
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+
+    # fall back to the font bundled with pygame if the requested one isn't installed
+    if args.font not in pygame.font.get_fonts():
+        PygameUI.registerFont(args.font, None)
+
+    header, events = PygameUI.loadTrace(args.trace)
+    scene = header["scene"]
+    if args.scene is not None:
+        scene = PygameUI.Scene.load(args.scene)
+    if scene is None:
+        print("the trace has no scene, pass one with --scene")
+        return 1
+
+    frames = replay(header, events, scene)
+    if not args.quiet:
+        for i, frame in enumerate(frames):
+            print("frame %6d  events %8.3f ms  draw %8.3f ms  %s" % (i, frame["event_ms"], frame["draw_ms"], frame["hash"]))
+    print("%d frames, %d events, %.2f ms handling events, %.2f ms drawing" % (
+        len(frames),
+        len(events),
+        sum(f["event_ms"] for f in frames),
+        sum(f["draw_ms"] for f in frames)
+    ))
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            different = compare(frames, json.load(f))
+        if different:
+            print("%d frames look different, the first is frame %d" % (len(different), different[0]))
+            status = 1
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(frames, f, indent=2)
+        print("saved results to %s" % args.save)
+
+    pygame.quit()
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
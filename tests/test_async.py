@@ -0,0 +1,52 @@
+# checks that coroutine onUpdate functions run alongside the UI instead of blocking it
+# run with: python -m unittest discover tests
+import os
+import sys
+import asyncio
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame
+import PygameUI
+
+
+class AsyncUpdateTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+
+    def setUp(self):
+        PygameUI.all_objects = PygameUI.UIObjectGroup()
+        self.log = []
+        self.slider = PygameUI.Slider((0, 0, 100, 20), 0, 10, sliderdefault=0, onUpdate=self.slowUpdate)
+
+    async def slowUpdate(self, value):
+        self.log.append(("start", value))
+        await asyncio.sleep(0.05)
+        self.log.append(("done", value))
+
+    def press(self):
+        PygameUI.all_objects.handleEvent(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(50, 10), button=1))
+
+    def test_without_event_loop(self):
+        with self.assertRaises(RuntimeError):
+            self.press()
+        self.assertEqual(self.log, [])
+
+    def test_with_event_loop(self):
+        async def main():
+            self.press()
+            # the handler has started, but the event was handled without waiting for it
+            self.assertTrue(self.slider.isPending())
+            while self.slider.isPending():
+                await asyncio.sleep(0.01)
+
+        asyncio.run(main())
+        self.assertEqual(self.log, [("start", 5), ("done", 5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
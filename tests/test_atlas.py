@@ -0,0 +1,70 @@
+# checks that WidgetAtlas packs backgrounds without overlapping them and stays within its budget
+# run with: python -m unittest discover tests
+import os
+import sys
+import time
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame
+import PygameUI
+
+PAGEBYTES = 256 * 256 * 4
+
+
+class WidgetAtlasTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+        if PygameUI.defaultfont not in pygame.font.get_fonts():
+            PygameUI.registerFont(PygameUI.defaultfont, None)
+
+    def setUp(self):
+        self.atlas = PygameUI.WidgetAtlas(pagesize=256, budget=2*PAGEBYTES)
+
+    def test_oversized_background_keeps_its_page(self):
+        bigpage, bigarea = self.atlas.getBackground((256, 400), (255, 0, 0), 0)
+        page, area = self.atlas.getBackground((50, 20), (0, 255, 0), 0)
+        self.assertIsNot(page, bigpage)
+        self.assertEqual(bigpage.get_at((20, 10)), pygame.Color(255, 0, 0))
+
+    def test_budget(self):
+        for i in range(2000):
+            self.atlas.getBackground((60, 30), (i % 256, i // 256, 0), 10)
+        stats = self.atlas.getStats()
+        self.assertLessEqual(stats["memory"], stats["budget"])
+        self.assertLessEqual(stats["pages"], 2)
+        self.assertGreater(stats["evictions"], 0)
+        self.assertEqual(stats["misses"], 2000)
+
+    def test_recently_used_backgrounds_are_kept(self):
+        kept = self.atlas.getBackground((60, 30), (1, 2, 3), 10)
+        for i in range(2000):
+            self.atlas.getBackground((60, 30), (i % 256, i // 256, 100), 10)
+            # used every frame, like a button that is always on screen
+            self.assertIs(self.atlas.getBackground((60, 30), (1, 2, 3), 10)[0], kept[0])
+        page, area = kept
+        self.assertEqual(page.get_at(area.center), pygame.Color(1, 2, 3))
+
+    def test_color_tween(self):
+        PygameUI.all_objects = PygameUI.UIObjectGroup()
+        group = PygameUI.all_objects
+        group.setBatched(True, self.atlas)
+        button = PygameUI.Button((10, 10, 80, 30), bgcolor=(0, 0, 0))
+        tweener = PygameUI.Tweener()
+        tweener.colorTo(button, "bgcolor", (255, 255, 255), 1)
+        surface = pygame.Surface((100, 50))
+        start = time.perf_counter()
+        for frame in range(300):
+            tweener.update(start + frame / 60)
+            group.draw(surface)
+        stats = self.atlas.getStats()
+        self.assertGreater(stats["evictions"], 0)
+        self.assertLessEqual(stats["memory"], stats["budget"])
+
+
+if __name__ == "__main__":
+    unittest.main()
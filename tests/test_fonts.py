@@ -0,0 +1,43 @@
+# checks that the fonts returned by getFont behave like the pygame fonts they stand in for
+# run with: python -m unittest discover tests
+import os
+import sys
+import copy
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame
+import PygameUI
+
+
+class LazyFontTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+        if PygameUI.defaultfont not in pygame.font.get_fonts():
+            PygameUI.registerFont(PygameUI.defaultfont, None)
+
+    def test_attributes_go_to_the_font(self):
+        font = PygameUI.LazyFont(PygameUI.defaultfont, 14)
+        font.size("x")
+        font.underline = True
+        self.assertTrue(font.resolve().underline)
+        self.assertTrue(font.underline)
+
+    def test_copy(self):
+        font = PygameUI.LazyFont(PygameUI.defaultfont, 15)
+        copied = copy.copy(font)
+        self.assertEqual(copied.size("abc"), font.size("abc"))
+        copied = copy.copy(font)
+        self.assertIs(copied.resolve(), font.resolve())
+
+    def test_dunders_are_not_forwarded(self):
+        font = PygameUI.LazyFont(PygameUI.defaultfont, 16)
+        self.assertFalse(hasattr(font, "__getstate_unknown__"))
+        self.assertIsNone(font.__dict__.get("font"))
+
+
+if __name__ == "__main__":
+    unittest.main()
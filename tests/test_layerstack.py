@@ -0,0 +1,71 @@
+# checks how LayerStack routes pointer events between its layers
+# run with: python -m unittest discover tests
+import os
+import sys
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame
+import PygameUI
+
+
+def mouse(eventtype, pos, **attributes):
+    if eventtype == pygame.MOUSEMOTION:
+        attributes.setdefault("rel", (0, 0))
+        attributes.setdefault("buttons", (1, 0, 0))
+    else:
+        attributes.setdefault("button", 1)
+    return pygame.event.Event(eventtype, pos=pos, **attributes)
+
+
+class LayerStackTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+        if PygameUI.defaultfont not in pygame.font.get_fonts():
+            PygameUI.registerFont(PygameUI.defaultfont, None)
+
+    def setUp(self):
+        PygameUI.all_objects = PygameUI.UIObjectGroup()
+        self.stack = PygameUI.LayerStack((255, 255, 255))
+        self.stack.addLayer("base", 0)
+        self.stack.addLayer("pop", 10)
+        self.values = []
+        self.slider = PygameUI.Slider((0, 0, 200, 20), 0, 10, sliderdefault=0, onUpdate=self.values.append)
+        self.stack.addObject("base", self.slider)
+        self.clicks = []
+        self.button = PygameUI.Button((150, 0, 50, 20), text="pop", onUpdate=lambda: self.clicks.append(1))
+        self.stack.addObject("pop", self.button)
+
+    def test_drag_across_layers(self):
+        self.stack.handleEvent(mouse(pygame.MOUSEBUTTONDOWN, (5, 10)))
+        self.stack.handleEvent(mouse(pygame.MOUSEMOTION, (160, 10)))
+        self.stack.handleEvent(mouse(pygame.MOUSEBUTTONUP, (160, 10)))
+        self.assertEqual(self.slider.getState(), 8)
+        self.assertFalse(self.slider.hasCapture())
+        self.assertEqual(self.clicks, [])
+
+        # the drag is over, moving without a button held doesn't change the value
+        self.stack.handleEvent(mouse(pygame.MOUSEMOTION, (20, 10), buttons=(0, 0, 0)))
+        self.assertEqual(self.slider.getState(), 8)
+
+    def test_commit_across_layers(self):
+        self.slider.setUpdateMode("commit")
+        self.stack.handleEvent(mouse(pygame.MOUSEBUTTONDOWN, (5, 10)))
+        self.stack.handleEvent(mouse(pygame.MOUSEMOTION, (160, 10)))
+        self.assertEqual(self.values, [])
+        self.stack.handleEvent(mouse(pygame.MOUSEBUTTONUP, (160, 10)))
+        self.assertEqual(self.values, [8])
+
+    def test_click_on_upper_layer(self):
+        self.stack.handleEvent(mouse(pygame.MOUSEBUTTONDOWN, (160, 10)))
+        self.stack.handleEvent(mouse(pygame.MOUSEBUTTONUP, (160, 10)))
+        self.assertEqual(self.clicks, [1])
+        self.assertEqual(self.slider.getState(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
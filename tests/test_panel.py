@@ -0,0 +1,61 @@
+# checks that Panels only redraw their children when something inside them changes
+# run with: python -m unittest discover tests
+import os
+import sys
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame
+import PygameUI
+
+
+# a UIObject that counts how often it is drawn
+class CountingObject(PygameUI.UIObject):
+    __slots__ = ("draws",)
+
+    def __init__(self, rect):
+        super().__init__(rect)
+        self.draws = 0
+
+    def draw(self, surface):
+        self.draws += 1
+        super().draw(surface)
+
+
+class PanelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+
+    def setUp(self):
+        PygameUI.all_objects = PygameUI.UIObjectGroup()
+        self.panel = PygameUI.Panel((10, 10, 100, 80), bgcolor=(230, 230, 230))
+        self.child = CountingObject((5, 5, 20, 20))
+        self.panel.addObject(self.child)
+        self.surface = pygame.Surface((300, 200))
+        self.panel.draw(self.surface)
+
+    def test_move_reuses_surface(self):
+        self.panel.move((5, 0))
+        self.panel.setRect([40, 30, None, None])
+        self.panel.draw(self.surface)
+        self.assertEqual(self.child.draws, 1)
+        # the cached surface, magenta child included, is copied to the new place
+        self.assertEqual(self.surface.get_at((50, 40)), pygame.Color(255, 0, 255))
+
+    def test_resize_redraws(self):
+        self.panel.setRect([None, None, 120, None])
+        self.panel.draw(self.surface)
+        self.assertEqual(self.child.draws, 2)
+
+    def test_child_change_redraws(self):
+        self.child.move((5, 0))
+        self.panel.draw(self.surface)
+        self.assertEqual(self.child.draws, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+# checks Textfield's editing against a plain string model of how the original Textfield handled keys
+# run with: python -m unittest discover tests
+import os
+import sys
+import random
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame
+import PygameUI
+
+KEYS = [pygame.K_BACKSPACE, pygame.K_LEFT, pygame.K_RIGHT, pygame.K_RETURN, pygame.K_a, pygame.K_SPACE]
+MODS = [0, 0, 0, pygame.KMOD_LMETA, pygame.KMOD_RMETA, pygame.KMOD_LALT, pygame.KMOD_RALT]
+UNICODE = {pygame.K_a: "a", pygame.K_SPACE: " ", pygame.K_RETURN: "\r"}
+
+
+def isCommand(mod):
+    return mod & (pygame.KMOD_LMETA | pygame.KMOD_RMETA)
+
+def isOption(mod):
+    return mod & (pygame.KMOD_LALT | pygame.KMOD_RALT)
+
+# applies a key press to text with the cursor at an index, the way Textfield originally did
+# -> (str, int)
+def pressKey(text, cursor, key, mod, unicode):
+    if key == pygame.K_BACKSPACE:
+        if cursor == 0:
+            return text, cursor
+        nextcursor = 0
+        if isCommand(mod):
+            for i in range(cursor-1, -1, -1):
+                if text[i] == "\n":
+                    nextcursor = i
+                    break
+        elif isOption(mod):
+            for i in range(cursor-2, -1, -1):
+                if text[i] in "\n ":
+                    nextcursor = i
+                    break
+        else:
+            nextcursor = cursor - 1
+        return text[:nextcursor] + text[cursor:], nextcursor
+
+    if key == pygame.K_RIGHT:
+        if cursor == len(text):
+            return text, cursor
+        if isCommand(mod):
+            index = text.find("\n", cursor)
+        elif isOption(mod):
+            index = min([i for i in (text.find("\n", cursor+1), text.find(" ", cursor+1)) if i != -1], default=-1)
+        else:
+            return text, cursor + 1
+        return text, len(text) if index == -1 else index
+
+    if key == pygame.K_LEFT:
+        if cursor == 0:
+            return text, cursor
+        if isCommand(mod):
+            return text, text.rfind("\n", 0, cursor) + 1
+        if isOption(mod):
+            return text, max(text.rfind("\n", 0, max(cursor-1, 0)), text.rfind(" ", 0, max(cursor-1, 0))) + 1
+        return text, cursor - 1
+
+    if key == pygame.K_RETURN:
+        return text[:cursor] + "\n" + text[cursor:], cursor + 1
+
+    return text[:cursor] + unicode + text[cursor:], cursor + len(unicode)
+
+
+class TextfieldEditingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+        # the default font usually isn't installed on test machines
+        if PygameUI.defaultfont not in pygame.font.get_fonts():
+            PygameUI.registerFont(PygameUI.defaultfont, None)
+
+    def setUp(self):
+        PygameUI.all_objects = PygameUI.UIObjectGroup()
+
+    def test_random_keys(self):
+        for seed in range(300):
+            rng = random.Random(seed)
+            text = "".join(rng.choice("ab \n") for _ in range(rng.randrange(15)))
+            field = PygameUI.Textfield((0, 0, 100, 60), defaulttext=text)
+            field.handleEvent(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(0, 0), button=1))
+            cursor = field.cursor
+            surface = pygame.Surface((120, 80))
+
+            for step in range(60):
+                key = rng.choice(KEYS)
+                mod = rng.choice(MODS)
+                unicode = UNICODE.get(key, "")
+                field.handleEvent(pygame.event.Event(pygame.KEYDOWN, key=key, unicode=unicode, mod=mod))
+                text, cursor = pressKey(text, cursor, key, mod, unicode)
+                # drawing keeps the line caches in use between edits
+                field.draw(surface)
+                self.assertEqual((field.getState(), field.cursor), (text, cursor), "seed %d, step %d" % (seed, step))
+
+
+if __name__ == "__main__":
+    unittest.main()
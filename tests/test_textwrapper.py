@@ -0,0 +1,118 @@
+# checks where TextWrapper breaks lines and that wrapped Textfields keep working
+# run with: python -m unittest discover tests
+import os
+import sys
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame
+import PygameUI
+
+TEXT = "the quick brown fox jumps over the lazy dog and keeps running until it is far away from here"
+
+
+# a font whose real widths are wider than its advances add up to, like a font with a lot of kerning
+class WideFont:
+    def __init__(self, font, extra):
+        self.font = font
+        self.extra = extra
+
+    def metrics(self, text):
+        return self.font.metrics(text)
+
+    def size(self, text):
+        width, height = self.font.size(text)
+        return (width + self.extra, height)
+
+
+class TextWrapperTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+        if PygameUI.defaultfont not in pygame.font.get_fonts():
+            PygameUI.registerFont(PygameUI.defaultfont, None)
+        cls.font = PygameUI.getFont(PygameUI.defaultfont, 14).resolve()
+
+    def setUp(self):
+        PygameUI.all_objects = PygameUI.UIObjectGroup()
+        self.wrapper = PygameUI.TextWrapper()
+
+    def assertFits(self, paragraph, breaks, width, font = None):
+        font = self.font if font is None else font
+        for start, end in breaks:
+            if end - start > 1:
+                self.assertLessEqual(font.size(paragraph[start:end].rstrip())[0], width, paragraph[start:end])
+
+    def test_lines_fit(self):
+        for mode in PygameUI.WRAPMODES:
+            for width in [40, 80, 150, 300]:
+                breaks = self.wrapper.getBreaks(TEXT, self.font, width, mode)
+                self.assertFits(TEXT, breaks, width)
+                self.assertEqual(" ".join(TEXT[start:end] for start, end in breaks).split(), TEXT.split())
+
+    def test_long_word(self):
+        paragraph = "a " + "x" * 60 + " b"
+        breaks = self.wrapper.getBreaks(paragraph, self.font, 50)
+        self.assertFits(paragraph, breaks, 50)
+        pieces = [paragraph[start:end] for start, end in breaks]
+        self.assertTrue(all(pieces))
+        self.assertEqual(pieces[0], "a")
+        # the end of the word shares a line with what comes after it
+        self.assertEqual("".join(pieces[1:]), "x" * 60 + " b")
+
+    def test_leading_spaces(self):
+        paragraph = "    indented text"
+        self.assertEqual(self.wrapper.getBreaks(paragraph, self.font, 1000), [(0, len(paragraph))])
+        breaks = self.wrapper.getBreaks(paragraph, self.font, self.font.size("    indented")[0])
+        self.assertEqual(paragraph[breaks[0][0]:breaks[0][1]], "    indented")
+        self.assertEqual(paragraph[breaks[1][0]:breaks[1][1]], "text")
+
+    def test_spaces_only(self):
+        self.assertEqual(self.wrapper.getBreaks("   ", self.font, 50), [(0, 3)])
+        self.assertEqual(self.wrapper.getBreaks("", self.font, 50), [(0, 0)])
+
+    def test_balanced(self):
+        width = self.font.size(TEXT)[0] * 2 // 3
+        greedy = self.wrapper.getBreaks(TEXT, self.font, width, "greedy")
+        balanced = self.wrapper.getBreaks(TEXT, self.font, width, "balanced")
+        self.assertEqual(len(balanced), len(greedy))
+        lengths = [self.font.size(TEXT[start:end])[0] for start, end in balanced]
+        greedylengths = [self.font.size(TEXT[start:end])[0] for start, end in greedy]
+        self.assertLess(max(lengths) - min(lengths), max(greedylengths) - min(greedylengths))
+
+    def test_balanced_falls_back_for_long_words(self):
+        paragraph = "short " + "x" * 40 + " words"
+        width = self.font.size("x" * 20)[0]
+        self.assertEqual(
+            self.wrapper.getBreaks(paragraph, self.font, width, "balanced"),
+            self.wrapper.getBreaks(paragraph, self.font, width, "greedy")
+        )
+
+    def test_balanced_falls_back_when_estimates_are_off(self):
+        width = self.font.size(TEXT)[0] // 3
+        font = WideFont(self.font, width // 2)
+        balanced = self.wrapper.getBreaks(TEXT, font, width, "balanced")
+        self.assertFits(TEXT, balanced, width, font)
+        self.assertEqual(balanced, self.wrapper.getBreaks(TEXT, font, width, "greedy"))
+
+    def test_cache(self):
+        breaks = self.wrapper.getBreaks(TEXT, self.font, 100)
+        self.assertIs(self.wrapper.getBreaks(TEXT, self.font, 100), breaks)
+        self.assertIsNot(self.wrapper.getBreaks(TEXT, self.font, 101), breaks)
+
+    def test_typing_into_wrapped_field(self):
+        field = PygameUI.Textfield((0, 0, 60, 200), wrap="greedy")
+        field.handleEvent(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(0, 0), button=1))
+        surface = pygame.Surface((60, 200))
+        for c in "the quick brown fox jumps over the lazy dog":
+            field.handleEvent(pygame.event.Event(pygame.KEYDOWN, key=ord(c), unicode=c, mod=0))
+            field.draw(surface)
+        self.assertEqual(field.getState(), "the quick brown fox jumps over the lazy dog")
+        self.assertGreater(len(field.getLineBreaks(0)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
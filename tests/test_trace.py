@@ -0,0 +1,69 @@
+# checks that traces recorded with TraceRecorder replay the same way they were recorded
+# run with: python -m unittest discover tests
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame
+import PygameUI
+import Replay
+
+
+class TraceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+        if PygameUI.defaultfont not in pygame.font.get_fonts():
+            PygameUI.registerFont(PygameUI.defaultfont, None)
+
+    @classmethod
+    def tearDownClass(cls):
+        PygameUI.textrasterizer.shutdown()
+
+    def setUp(self):
+        PygameUI.all_objects = PygameUI.UIObjectGroup()
+
+    def test_wheel_position(self):
+        scene = PygameUI.Scene({"widgets": [
+            {"type": "ListView", "id": "list", "rect": [50, 50, 200, 100], "data": [str(i) for i in range(100)]}
+        ]})
+        group, ids = scene.build({})
+        recorder = PygameUI.TraceRecorder(group, scene, (300, 200))
+        recorder.start()
+        with mock.patch("pygame.mouse.get_pos", return_value=(100, 100)):
+            group.handleEvent(pygame.event.Event(pygame.MOUSEWHEEL, x=0, y=-1, flipped=False))
+            group.draw(pygame.Surface((300, 200)))
+        recorder.stop()
+        self.assertGreater(ids["list"].scroll, 0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "wheel.trace")
+            recorder.save(path)
+            header, events = PygameUI.loadTrace(path)
+        self.assertEqual(tuple(events[0][3]["pos"]), (100, 100))
+
+        # the pointer is somewhere else while replaying
+        group, replayed = header["scene"].build({})
+        with mock.patch("pygame.mouse.get_pos", return_value=(0, 0)):
+            group.handleEvent(pygame.event.Event(events[0][2], events[0][3]))
+        self.assertEqual(replayed["list"].scroll, ids["list"].scroll)
+
+    def test_threaded_text_is_finished(self):
+        header = {"size": (200, 100), "frames": 2, "scene": None}
+        frames = {}
+        for threaded in [False, True]:
+            scene = PygameUI.Scene({"widgets": [
+                {"type": "Textbox", "rect": [10, 10, 180, 0], "text": "some text " * 20, "wrap": "greedy", "threaded": threaded}
+            ]})
+            frames[threaded] = Replay.replay(header, [], scene)
+        self.assertEqual([f["hash"] for f in frames[True]], [f["hash"] for f in frames[False]])
+
+
+if __name__ == "__main__":
+    unittest.main()